@@ -0,0 +1,71 @@
+"""
+:mod:`api` --- Library interface to the lab generator
+=============================================
+Generate Kathara labs from Python without going through the command line or
+the file system::
+
+    lab = generate_lab(tree, network="10.0.0.0/8")
+    lab.devices["br1_1"]["startup"]
+    write_lab(lab, output_dir="kathara_lab")
+"""
+# Stdlib
+import argparse
+
+from caida_kathara.config import (
+    ConfigGenerator,
+    ConfigGenArgs,
+    add_arguments,
+    check_arguments,
+)
+from caida_kathara.defines import GEN_PATH
+from caida_kathara.kathara import KatharaLab
+from caida_kathara.util import lab_writer
+
+
+def config_args(**options) -> ConfigGenArgs:
+    """
+    Build generator arguments from the command line defaults.
+
+    :param options: Command line options by attribute name, e.g.
+        ``ipv6=True`` or ``network_v6="fd00::/104"``.
+    :raises ValueError: If an option value is invalid.
+    """
+    namespace = add_arguments(argparse.ArgumentParser()).parse_args([])
+    for name, value in options.items():
+        if not hasattr(namespace, name):
+            raise TypeError("unknown option: {}".format(name))
+        setattr(namespace, name, value)
+    return ConfigGenArgs(check_arguments(namespace))
+
+
+def generate_lab(caida_config, name=None, **options) -> KatharaLab:
+    """
+    Generate a lab in memory.
+
+    :param caida_config: The CAIDA topology as a path, file object,
+        ElementTree or Element.
+    :param str name: Name of an in-memory topology in the lab description.
+        Defaults to the name of a file object.
+    :param options: Command line options by attribute name, see config_args.
+    :returns: The generated KatharaLab, with its devices, collision domains,
+        networks and rendered files.
+    """
+    if isinstance(caida_config, str):
+        return ConfigGenerator(config_args(caida_config=caida_config, **options)).generate_lab()
+    # File objects keep their name in the lab description. Other inputs get a
+    # neutral one instead of the name of the default topology file.
+    if name is None and isinstance(getattr(caida_config, 'name', None), str):
+        name = caida_config.name
+    options['caida_config'] = name
+    return ConfigGenerator(config_args(**options), caida_config).generate_lab()
+
+
+def write_lab(lab: KatharaLab, output_dir=GEN_PATH, output_archive=None):
+    """
+    Write a generated lab to a directory or archive.
+    """
+    writer = lab_writer(output_dir, output_archive)
+    try:
+        lab.write(writer)
+    finally:
+        writer.close()
@@ -0,0 +1,219 @@
+"""
+:mod:`bgp` --- FRR BGP configuration generator
+=============================================
+Generates an FRR configuration for every border router. eBGP sessions follow
+the inter-AS links, with the Gao-Rexford policy applied through one peer group
+per relationship. Inside an AS, iBGP runs either as a full mesh or through a
+set of route reflectors, and OSPF over the intra-AS links resolves the iBGP
+next hops.
+"""
+# Stdlib
+import ast
+import json
+import logging
+from collections import defaultdict
+from itertools import permutations
+
+from caida_kathara.common import LinkRel
+from caida_kathara.defines import IBGP_FULL_MESH, RR_SELECTION_GEO
+from caida_kathara.util import calculate_great_circle_latency
+
+FRR_CONF = 'etc/frr/frr.conf'
+FRR_DAEMONS = 'etc/frr/daemons'
+BGP_REPORT_FILE = 'bgp_sessions.json'
+
+FRR_DAEMONS_CONF = """zebra=yes
+bgpd=yes
+ospfd=yes
+vtysh_enable=yes
+zebra_options="  -A 127.0.0.1 -s 90000000"
+bgpd_options="   -A 127.0.0.1"
+ospfd_options="  -A 127.0.0.1"
+"""
+
+# eBGP peer group per relationship of the remote AS
+EBGP_GROUPS = {
+    LinkRel.CUSTOMER: "EBGP-CUSTOMER",
+    LinkRel.PEER: "EBGP-PEER",
+    LinkRel.SIBLING: "EBGP-PEER",
+    LinkRel.PROVIDER: "EBGP-PROVIDER",
+}
+
+# Gao-Rexford policy: routes are tagged with a large community and a local
+# preference by the relationship they were learned over, and routes from peers
+# and providers are only exported to customers.
+POLICY_TEMPLATE = """bgp large-community-list standard LC-NONCUSTOMER permit {asn}:0:2
+bgp large-community-list standard LC-NONCUSTOMER permit {asn}:0:3
+!
+route-map RM-FROM-CUSTOMER permit 10
+ set local-preference 200
+ set large-community {asn}:0:1
+!
+route-map RM-FROM-PEER permit 10
+ set local-preference 100
+ set large-community {asn}:0:2
+!
+route-map RM-FROM-PROVIDER permit 10
+ set local-preference 50
+ set large-community {asn}:0:3
+!
+route-map RM-TO-CUSTOMER permit 10
+!
+route-map RM-TO-NONCUSTOMER deny 10
+ match large-community LC-NONCUSTOMER
+!
+route-map RM-TO-NONCUSTOMER permit 20
+!
+"""
+
+
+class BGPConfigGenerator(object):
+    def __init__(self, args, caida_dicts, networks):
+        """
+        :param object args: Contains the passed command line arguments as named attributes.
+        :param dict caida_dicts: The generated topo dicts from TopoGenerator.
+        :param dict networks: The generated networks from SubnetGenerator.
+        """
+        self.args = args
+        self.caida_dicts = caida_dicts
+        self.router_as = {}
+        for as_id, as_conf in caida_dicts.items():
+            for br in as_conf["routers"]:
+                self.router_as[br] = as_id
+        # Router to a list of (local address, remote router, remote address, subnet)
+        self.adjacencies = defaultdict(list)
+        for net, desc in sorted(networks.items(), key=lambda x: (x[0].version, x[0])):
+            for br1, br2 in permutations(ast.literal_eval(desc.name), 2):
+                self.adjacencies[br1].append((desc.ip_net[br1], br2, desc.ip_net[br2], net))
+        self.report = {}
+
+    def generate(self):
+        """
+        :returns: Router name to the content of its frr.conf.
+        """
+        confs = {}
+        for as_id, as_conf in sorted(self.caida_dicts.items()):
+            routers = sorted(as_conf["routers"])
+            reflectors = self._reflectors(as_id, routers)
+            for br in routers:
+                confs[br] = self._frr_conf(as_id, br, routers, reflectors)
+            self._report_as(as_id, routers, reflectors)
+        self._log_report()
+        return confs
+
+    def _reflectors(self, as_id, routers):
+        if self.args.ibgp == IBGP_FULL_MESH or len(routers) <= 2:
+            return []
+        count = min(self.args.rr_count, len(routers))
+        if self.args.rr_selection == RR_SELECTION_GEO:
+            key = lambda br: (self._total_latency(as_id, br, routers), br)
+        else:
+            key = lambda br: (-self._ebgp_degree(br), br)
+        return sorted(sorted(routers, key=key)[:count])
+
+    def _ebgp_degree(self, br):
+        return sum(1 for _, remote, _, _ in self.adjacencies[br]
+                   if self.router_as[remote] != self.router_as[br])
+
+    def _total_latency(self, as_id, br, routers):
+        conf = self.caida_dicts[as_id]["routers"]
+        return sum(calculate_great_circle_latency(conf[br]["latitude"], conf[br]["longitude"],
+                                                  conf[r]["latitude"], conf[r]["longitude"])
+                   for r in routers)
+
+    def _ibgp_peers(self, br, routers, reflectors):
+        """
+        :returns: List of (remote router, peer group) of the iBGP sessions of br.
+        """
+        if not reflectors:
+            return [(r, "IBGP") for r in routers if r != br]
+        if br in reflectors:
+            return ([(r, "IBGP") for r in reflectors if r != br] +
+                    [(r, "IBGP-CLIENT") for r in routers if r not in reflectors])
+        return [(r, "IBGP") for r in reflectors]
+
+    def _frr_conf(self, as_id, br, routers, reflectors):
+        adjacencies = self.adjacencies[br]
+        router_id = min((local.ip for local, _, _, _ in adjacencies), default=None)
+        internal = {remote: (local, remote_ip, net)
+                    for local, remote, remote_ip, net in adjacencies
+                    if self.router_as[remote] == as_id}
+        ebgp = [(remote, remote_ip) for _, remote, remote_ip, _ in adjacencies
+                if self.router_as[remote] != as_id]
+        ibgp = self._ibgp_peers(br, routers, reflectors)
+
+        groups = sorted({group for _, group in ibgp})
+        ebgp_groups = sorted({EBGP_GROUPS[self._relationship(as_id, remote)]
+                              for remote, _ in ebgp})
+        lines = [f"frr defaults traditional", f"hostname {br}", "!"]
+        lines.append(POLICY_TEMPLATE.format(asn=as_id).rstrip("\n"))
+        lines.append("router ospf")
+        lines.append(f" ospf router-id {router_id}")
+        for net in sorted({net for _, _, net in internal.values()}):
+            lines.append(f" network {net} area 0")
+        lines.append("!")
+        lines.append(f"router bgp {as_id}")
+        lines.append(f" bgp router-id {router_id}")
+        for group in groups:
+            lines.append(f" neighbor {group} peer-group")
+            lines.append(f" neighbor {group} remote-as internal")
+        for group in ebgp_groups:
+            lines.append(f" neighbor {group} peer-group")
+            lines.append(f" neighbor {group} remote-as external")
+        for remote, group in ibgp:
+            if remote in internal:
+                lines.append(f" neighbor {internal[remote][1].ip} peer-group {group}")
+            else:
+                # Not directly connected (split routers): peer between the
+                # addresses announced in OSPF.
+                lines.append(f" neighbor {self._ibgp_addr(remote)} peer-group {group}")
+                lines.append(f" neighbor {self._ibgp_addr(remote)} update-source {self._ibgp_addr(br)}")
+        for remote, remote_ip in ebgp:
+            group = EBGP_GROUPS[self._relationship(as_id, remote)]
+            lines.append(f" neighbor {remote_ip.ip} peer-group {group}")
+        lines.append(" !")
+        lines.append(" address-family ipv4 unicast")
+        lines.append("  redistribute connected")
+        for group in groups:
+            lines.append(f"  neighbor {group} activate")
+            lines.append(f"  neighbor {group} next-hop-self")
+            lines.append(f"  neighbor {group} send-community large")
+            if group == "IBGP-CLIENT":
+                lines.append(f"  neighbor {group} route-reflector-client")
+        for group in ebgp_groups:
+            suffix = group.split("-", 1)[1]
+            lines.append(f"  neighbor {group} activate")
+            lines.append(f"  neighbor {group} route-map RM-FROM-{suffix} in")
+            out = "RM-TO-CUSTOMER" if suffix == "CUSTOMER" else "RM-TO-NONCUSTOMER"
+            lines.append(f"  neighbor {group} route-map {out} out")
+        lines.append(" exit-address-family")
+        lines.append("!")
+        return "\n".join(lines) + "\n"
+
+    def _ibgp_addr(self, br):
+        return min(local.ip for local, remote, _, _ in self.adjacencies[br]
+                   if self.router_as[remote] == self.router_as[br])
+
+    def _relationship(self, as_id, remote_br):
+        return self.caida_dicts[as_id]["relationships"][self.router_as[remote_br]]
+
+    def _report_as(self, as_id, routers, reflectors):
+        ebgp = sum(self._ebgp_degree(br) for br in routers)
+        ibgp = sum(len(self._ibgp_peers(br, routers, reflectors)) for br in routers) // 2
+        self.report[as_id] = {
+            "routers": len(routers),
+            "reflectors": reflectors,
+            "ebgp_sessions": ebgp,
+            "ibgp_sessions": ibgp,
+            "ibgp_full_mesh_sessions": len(routers) * (len(routers) - 1) // 2,
+        }
+
+    def _log_report(self):
+        ibgp = sum(r["ibgp_sessions"] for r in self.report.values())
+        full_mesh = sum(r["ibgp_full_mesh_sessions"] for r in self.report.values())
+        ebgp = sum(r["ebgp_sessions"] for r in self.report.values()) // 2
+        logging.info("BGP: %d eBGP sessions, %d iBGP sessions (full mesh: %d)",
+                     ebgp, ibgp, full_mesh)
+
+    def report_json(self):
+        return json.dumps(self.report, indent=2, sort_keys=True) + "\n"
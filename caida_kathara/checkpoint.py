@@ -0,0 +1,171 @@
+"""
+:mod:`checkpoint` --- Resumable generator runs
+=============================================
+Saves the result of every generator phase (parse, clustering, allocation and
+rendering) in a checkpoint directory, together with a journal of the lab
+files already written. A resumed run loads the latest phase and skips the
+journaled files, and ends with the same lab as an uninterrupted run. The
+directory is removed once the lab is complete.
+
+Checkpoints are only reused by runs with the same options on the same,
+unmodified topology file.
+"""
+# Stdlib
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import zlib
+
+from caida_kathara.topo import TopoCache
+
+CHECKPOINT_DIR = '.checkpoint'
+MANIFEST_FILE = 'manifest.json'
+JOURNAL_FILE = 'written'
+FORMAT_VERSION = 1
+
+#: Options that do not change the generated lab
+OUTPUT_OPTIONS = ('output_dir', 'output_archive', 'checkpoint', 'resume')
+
+
+class Checkpoint(TopoCache):
+    """
+    TopoCache kept in a checkpoint directory, which also holds the allocated
+    networks, the rendered lab and the journal of written files.
+    """
+
+    def __init__(self, path, fingerprint, resume=False):
+        """
+        :param str path: The checkpoint directory.
+        :param str fingerprint: Identifies the options and topology of the run.
+        :param bool resume: Continue from the checkpoint in path if it has
+            the same fingerprint, instead of starting over.
+        """
+        super().__init__()
+        self.path = path
+        self.written = set()
+        if resume and self._read_manifest() == fingerprint:
+            self.written = self._read_journal()
+            logging.info("Resuming from %s (%d files already written)", path, len(self.written))
+            return
+        if resume:
+            logging.warning("No matching checkpoint in %s, starting from scratch", path)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        _atomic_write(os.path.join(path, MANIFEST_FILE), json.dumps(
+            {"version": FORMAT_VERSION, "fingerprint": fingerprint}).encode())
+
+    def has(self, name):
+        return os.path.exists(self._file(name))
+
+    def load(self, name):
+        try:
+            with open(self._file(name), 'rb') as f:
+                return zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+    def store(self, name, data):
+        _atomic_write(self._file(name), zlib.compress(data, 1))
+        logging.info("Checkpoint: %s", name)
+
+    def load_state(self, name):
+        """
+        :returns: The unpickled state saved under name, or None.
+        """
+        data = self.load(name)
+        return None if data is None else pickle.loads(data)
+
+    def store_state(self, name, state):
+        self.store(name, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def journal(self, writer):
+        """
+        Wrap a DirWriter to skip the files written before the interruption
+        and record the new ones.
+        """
+        return JournalWriter(writer, self.written, os.path.join(self.path, JOURNAL_FILE))
+
+    def finish(self):
+        shutil.rmtree(self.path)
+
+    def _file(self, name):
+        return os.path.join(self.path, name + '.ckpt')
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != FORMAT_VERSION:
+            return None
+        return manifest.get("fingerprint")
+
+    def _read_journal(self):
+        try:
+            with open(os.path.join(self.path, JOURNAL_FILE)) as f:
+                return set(f.read().splitlines())
+        except FileNotFoundError:
+            return set()
+
+
+class JournalWriter(object):
+    """
+    Writer that skips already written files and appends every file it
+    writes to a journal, once the file is complete.
+    """
+
+    def __init__(self, writer, written, journal_path):
+        self.writer = writer
+        self.written = written
+        self.skipped = 0
+        self._journal = open(journal_path, 'a')
+
+    def write(self, rel_path, text):
+        if rel_path in self.written:
+            self.skipped += 1
+            return
+        self.writer.write(rel_path, text)
+        self._journal.write(rel_path + "\n")
+        self._journal.flush()
+
+    def close(self):
+        self._journal.close()
+        self.writer.close()
+        if self.skipped:
+            logging.info("Skipped %d files written before the interruption", self.skipped)
+
+
+def checkpoint_path(args):
+    """
+    The checkpoint directory of a run: inside the output directory, or next
+    to the output archive.
+    """
+    if args.output_archive:
+        return args.output_archive + CHECKPOINT_DIR
+    return os.path.join(args.output_dir, CHECKPOINT_DIR)
+
+
+def run_fingerprint(args):
+    """
+    Hash of the options that shape the lab and of the path, size and
+    modification time of the topology file.
+    """
+    options = {k: v for k, v in vars(args).items() if k not in OUTPUT_OPTIONS}
+    try:
+        st = os.stat(args.caida_config)
+        source = [os.path.abspath(args.caida_config), st.st_size, st.st_mtime_ns]
+    except (OSError, TypeError):
+        source = None
+    data = json.dumps([FORMAT_VERSION, options, source], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _atomic_write(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
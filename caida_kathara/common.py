@@ -16,9 +16,6 @@
 from enum import Enum
 from ipaddress import ip_address
 from typing import Mapping, Tuple
-from urllib.parse import urlsplit
-import os
-import subprocess
 
 from caida_kathara.net import AddressProxy, NetworkDescription, IPNetwork
 
@@ -42,6 +39,7 @@ LinkRel = Enum('LinkRel', ['CUSTOMER', 'PROVIDER', 'PEER', 'SIBLING'])
 
 
 def split_host_port(addr: str) -> Tuple[str, int]:
+    from urllib.parse import urlsplit
     parts = urlsplit('//' + addr)
     if parts.port is None:
         raise ValueError("missing port in addr: {}".format(addr))
@@ -75,6 +73,7 @@ def docker_host(docker, addr=None):
 
 
 def docker_ip():
+    import subprocess
     return subprocess.check_output(['tools/docker-ip']).decode("utf-8").strip()
 
 
@@ -18,18 +18,23 @@
 """
 # Stdlib
 import configparser
-import json
-import logging
-import os
-import sys
 from io import StringIO
 from typing import Mapping
 import xml.etree.ElementTree as et
 
 from caida_kathara.defines import (
+    GEN_PATH,
+    DEFAULT_NETWORK,
+    DEFAULT6_NETWORK,
+    DEFAULT_CAIDA_FILE,
+    IBGP_FULL_MESH,
+    IBGP_ROUTE_REFLECTOR,
     NETWORKS_FILE,
+    NETWORKS_INDEX_FILE,
+    RR_SELECTION_DEGREE,
+    RR_SELECTION_GEO,
 )
-from caida_kathara.util import write_file
+from caida_kathara.util import check_archive_path, lab_writer
 from caida_kathara.common import ArgsBase
 from caida_kathara.kathara import KatharaLabGenerator, KatharaLabGenArgs
 from caida_kathara.net import (
@@ -37,28 +42,129 @@ from caida_kathara.net import (
     IPNetwork,
     SubnetGenerator,
 )
-from caida_kathara.topo import TopoGenArgs, TopoGenerator
+from caida_kathara.topo import (
+    BR_CLUSTERING_BATCH,
+    BR_CLUSTERING_GREEDY,
+    TopoGenArgs,
+    TopoGenerator,
+)
 
 
 class ConfigGenArgs(ArgsBase):
     pass
 
 
+def add_arguments(parser):
+    parser.add_argument('-c', '--caida-config', default=DEFAULT_CAIDA_FILE,
+                        help='Path policy file')
+    parser.add_argument('-n', '--network', default=DEFAULT_NETWORK,
+                        help='IPv4 network to create subnets in (E.g. "127.0.0.0/8"')
+    parser.add_argument('-n6', '--network-v6', default=DEFAULT6_NETWORK,
+                        help='IPv6 network to create subnets in (E.g. "fd00:f00d:cafe::7f00:0000/104"')
+    parser.add_argument('-v6', '--ipv6', action='store_true',
+                        help='Use IPv6')
+    parser.add_argument('-o', '--output-dir', default=GEN_PATH,
+                        help='Output directory')
+    parser.add_argument('--networks-index', action='store_true',
+                        help='Also write networks.idx, an indexed binary form of networks.conf '
+                             'for fast address and device lookups')
+    parser.add_argument('--output-archive',
+                        help='Stream the lab into a single deterministic archive instead of the '
+                             'output directory (.tar, .tar.gz, .tar.xz or .tar.zst)')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='Save the state after every phase in the output directory, so an '
+                             'interrupted run can be resumed')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted --checkpoint run, skipping the completed '
+                             'phases and the files already written')
+    parser.add_argument('-m', '--megalos', action='store_true',
+                        help='Generate Kathara Lab to run on Kubernetes (Megalos)')
+    parser.add_argument('--docker-registry', help='Specify docker registry to pull images from')
+    parser.add_argument('--image-tag', default='latest', help='Docker image tag')
+    parser.add_argument('--br-clustering', choices=[BR_CLUSTERING_GREEDY, BR_CLUSTERING_BATCH],
+                        default=BR_CLUSTERING_GREEDY,
+                        help='Assign link locations to border routers greedily in link order, or '
+                             'cluster all locations of an AS in one order-independent batch')
+    parser.add_argument('--max-interfaces', type=int,
+                        help='Split border routers with more interfaces into chassis joined by '
+                             'a local collision domain')
+    parser.add_argument('--static-routes', action='store_true',
+                        help='Install precomputed valley-free static routes instead of relying '
+                             'on a routing daemon')
+    parser.add_argument('--routing-workers', type=int,
+                        help='Number of processes computing the static routes (default: CPU count)')
+    parser.add_argument('--bgp', action='store_true',
+                        help='Generate FRR BGP configurations for the border routers')
+    parser.add_argument('--ibgp', choices=[IBGP_FULL_MESH, IBGP_ROUTE_REFLECTOR],
+                        default=IBGP_ROUTE_REFLECTOR,
+                        help='iBGP topology inside each AS')
+    parser.add_argument('--rr-selection', choices=[RR_SELECTION_DEGREE, RR_SELECTION_GEO],
+                        default=RR_SELECTION_DEGREE,
+                        help='Pick route reflectors by eBGP degree or geographic centrality')
+    parser.add_argument('--rr-count', type=int, default=2,
+                        help='Number of route reflectors per AS')
+    parser.add_argument('--shared-startup', action='store_true',
+                        help='Write one shared startup template and a per-device parameter table '
+                             'instead of a startup file per device')
+    return parser
+
+
+def check_arguments(args):
+    """
+    Reject invalid option values before any work is done.
+
+    :raises ValueError: With the reason, for parser.error or API callers.
+    """
+    if args.max_interfaces is not None and args.max_interfaces < 2:
+        raise ValueError("--max-interfaces must be at least 2")
+    if args.rr_count < 1:
+        raise ValueError("--rr-count must be at least 1")
+    if args.bgp and args.ipv6:
+        raise ValueError("--bgp is only supported for IPv4 labs")
+    if args.shared_startup and args.megalos:
+        raise ValueError("--shared-startup is not supported with --megalos")
+    if args.output_archive:
+        check_archive_path(args.output_archive)
+    return args
+
+
 class ConfigGenerator(object):
     """
     Configuration and/or topology generator.
     """
 
-    def __init__(self, args):
+    def __init__(self, args, caida_config=None, topo_cache=None):
         """
         Initialize an instance of the class ConfigGenerator.
 
         :param ConfigGenArgs args: Contains the passed command line arguments.
+        :param caida_config: An already loaded CAIDA topology (ElementTree,
+            Element or file object). If None, args.caida_config is parsed.
+        :param TopoCache topo_cache: Warm state of earlier runs on the same
+            topology. The topology is not parsed again if it holds the config.
         """
         self.args = args
-        with open(self.args.caida_config) as f:
-            self.caida_config = et.parse(f)
-        
+        self.checkpoint = None
+        if topo_cache is None and (self.args.checkpoint or self.args.resume):
+            # Checkpoint support is imported on demand, plain runs do not need it.
+            from caida_kathara.checkpoint import Checkpoint, checkpoint_path, run_fingerprint
+            self.checkpoint = topo_cache = Checkpoint(checkpoint_path(self.args),
+                                                      run_fingerprint(self.args),
+                                                      self.args.resume)
+        self.topo_cache = topo_cache
+        self.cache_status = {}
+        if topo_cache is not None and topo_cache.has("parse"):
+            self.caida_config = None
+        elif caida_config is None:
+            with open(self.args.caida_config) as f:
+                self.caida_config = et.parse(f)
+        elif isinstance(caida_config, et.ElementTree):
+            self.caida_config = caida_config
+        elif isinstance(caida_config, et.Element):
+            self.caida_config = et.ElementTree(caida_config)
+        else:
+            self.caida_config = et.parse(caida_config)
+
         self.subnet_gen4 = SubnetGenerator(self.args.network)
         self.subnet_gen6 = SubnetGenerator(self.args.network_v6)
 
@@ -67,13 +173,62 @@ class ConfigGenerator(object):
         """
         Generate all needed files.
         """
-        caida_dicts, self.all_networks = self._generate_topology()
+        lab = self.generate_lab()
+        writer = lab_writer(self.args.output_dir, self.args.output_archive)
+        # Archives are streams, an interrupted one is written again as a whole.
+        if self.checkpoint is not None and not self.args.output_archive:
+            writer = self.checkpoint.journal(writer)
+        try:
+            lab.write(writer)
+        finally:
+            writer.close()
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
+
+    def generate_lab(self):
+        """
+        Generate the lab in memory, without writing anything to disk.
+
+        :returns: The generated KatharaLab.
+        """
+        lab = self._load_checkpoint("rendering")
+        if lab is not None:
+            return lab
+        topology = self._load_checkpoint("allocation")
+        if topology is None:
+            topology = self._generate_topology()
+            self._store_checkpoint("allocation", topology)
+        caida_dicts, self.all_networks = topology
         self.networks = remove_v4_nets(self.all_networks)
-        self._generate_kathara(caida_dicts)
-        self._write_networks_conf(self.networks, NETWORKS_FILE)      
+        lab = self._generate_kathara(caida_dicts)
+        lab.extra_files[NETWORKS_FILE] = self._networks_conf(self.networks)
+        if self.args.networks_index:
+            from caida_kathara.netindex import build_networks_index
+            lab.extra_files[NETWORKS_INDEX_FILE] = build_networks_index(lab)
+        self._store_checkpoint("rendering", lab)
+        return lab
+
+    def _load_checkpoint(self, phase):
+        if self.checkpoint is None:
+            return None
+        return self.checkpoint.load_state(phase)
+
+    def _store_checkpoint(self, phase, state):
+        if self.checkpoint is not None:
+            self.checkpoint.store_state(phase, state)
+
+    def warm_topo_cache(self):
+        """
+        Parse the topology and cluster its border routers into the topology
+        cache, without allocating addresses or rendering the lab.
+        """
+        topo_gen = TopoGenerator(self._topo_args(), self.topo_cache)
+        self.cache_status = topo_gen.cache_status
+        topo_gen.cluster()
 
     def _generate_topology(self):
-        topo_gen = TopoGenerator(self._topo_args())
+        topo_gen = TopoGenerator(self._topo_args(), self.topo_cache)
+        self.cache_status = topo_gen.cache_status
         return topo_gen.generate()
 
     def _topo_args(self):
@@ -83,14 +238,12 @@ class ConfigGenerator(object):
     def _generate_kathara(self, caida_dicts):
         args = self._kathara_args(caida_dicts)
         kathara_gen = KatharaLabGenerator(args)
-        kathara_gen.generate_lab()
+        return kathara_gen.generate_lab()
 
     def _kathara_args(self, caida_dicts):
         return KatharaLabGenArgs(self.args, caida_dicts, self.networks)
 
-    def _write_networks_conf(self,
-                             networks: Mapping[IPNetwork, NetworkDescription],
-                             out_file: str):
+    def _networks_conf(self, networks: Mapping[IPNetwork, NetworkDescription]) -> str:
         config = configparser.ConfigParser(interpolation=None)
         for net, net_desc in networks.items():
             sub_conf = {}
@@ -99,7 +252,7 @@ class ConfigGenerator(object):
             config[str(net)] = sub_conf
         text = StringIO()
         config.write(text)
-        write_file(os.path.join(self.args.output_dir, out_file), text.getvalue())
+        return text.getvalue()
 
 
 def remove_v4_nets(nets: Mapping[IPNetwork, NetworkDescription]
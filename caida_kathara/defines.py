@@ -23,6 +23,15 @@ GEN_PATH = 'kathara_lab'
 DEFAULT_CAIDA_FILE = "default.xml"
 #: Networks config
 NETWORKS_FILE = "networks.conf"
+#: Indexed binary companion of the networks config
+NETWORKS_INDEX_FILE = "networks.idx"
+
+#: iBGP topologies inside an AS
+IBGP_FULL_MESH = 'full-mesh'
+IBGP_ROUTE_REFLECTOR = 'route-reflector'
+#: Route reflector selection modes
+RR_SELECTION_DEGREE = 'degree'
+RR_SELECTION_GEO = 'geo'
 
 # Default IPv4 network
 DEFAULT_NETWORK = "10.0.0.0/8"
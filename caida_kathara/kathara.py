@@ -1,12 +1,11 @@
 # Stdlib
-import os
 from typing import Mapping
 import string
 # External packages
 import ast
 
 from caida_kathara.defines import GEN_PATH
-from caida_kathara.util import write_file, calculate_great_circle_latency
+from caida_kathara.util import calculate_great_circle_latency
 from caida_kathara.common import (
     ArgsCaidaDicts,
     docker_image,
@@ -14,6 +13,24 @@ from caida_kathara.common import (
 from caida_kathara.net import NetworkDescription, IPNetwork
 
 KATHARA_LAB_CONF = 'lab.conf'
+KATHARA_SHARED_STARTUP = 'shared.startup'
+# Static routes batch, in the device directory
+STATIC_ROUTES_FILE = 'etc/static-routes'
+# Startup parameters of the shared template, in the device directory
+STARTUP_PARAMS_FILE = 'etc/startup.params'
+
+# Static route in `ip -batch` syntax
+STATIC_ROUTE_CMD = 'route add {net} via {via}'
+
+# Startup command templates, keyed by the operation name. The shared
+# template replays them from the parameter file of each device.
+STARTUP_CMDS = {
+    "addr": 'ip addr add {arg} dev {ifname}',
+    "addr6": 'ip -6 addr add {arg} dev {ifname}',
+    "delay": 'tc qdisc add dev {ifname} root netem delay {arg}ms',
+    "routes": f'ip -batch /{STATIC_ROUTES_FILE}',
+    "frr": 'systemctl start frr',
+}
 
 
 class KatharaLabGenArgs(ArgsCaidaDicts):
@@ -28,6 +45,86 @@ class KatharaLabGenArgs(ArgsCaidaDicts):
         self.networks = networks
 
 
+class KatharaLab(object):
+    """
+    In-memory model of a generated Kathara lab. Nothing is written to disk
+    until write() is called; the file contents are rendered on the fly.
+    """
+
+    def __init__(self, lab_conf, devices, collision_domains, networks, shared_startup=False,
+                 if_name="eth"):
+        """
+        :param str lab_conf: The content of lab.conf.
+        :param dict devices: Device name to its image, interfaces (interface id
+            to collision domain), startup and shutdown commands and the files
+            of its device directory, including the static routes batch.
+        :param dict collision_domains: Collision domain to its network, link
+            name and attached devices (device name to interface id).
+        :param dict networks: The generated networks from SubnetGenerator.
+        :param bool shared_startup: Render a shared startup template and
+            parameter table instead of per-device startup files.
+        :param str if_name: The interface name prefix of the devices.
+        """
+        self.lab_conf = lab_conf
+        self.devices = devices
+        self.collision_domains = collision_domains
+        self.networks = networks
+        self.shared_startup = shared_startup
+        self.if_name = if_name
+        self.extra_files = {}
+
+    def startup_commands(self, device):
+        return self.devices[device]["startup"].splitlines()
+
+    def iter_files(self):
+        """
+        Yield the (relative path, content) pairs of all lab files.
+        """
+        yield KATHARA_LAB_CONF, self.lab_conf
+        if self.shared_startup:
+            yield KATHARA_SHARED_STARTUP, shared_startup_template(self.if_name)
+        for dev_id, info in self.devices.items():
+            if self.shared_startup:
+                yield f"{dev_id}/{STARTUP_PARAMS_FILE}", self._startup_params(dev_id, info)
+            else:
+                yield f"{dev_id}.startup", info["startup"]
+            if info["shutdown"]:
+                yield f"{dev_id}.shutdown", info["shutdown"]
+            for rel_path, text in info["files"].items():
+                yield f"{dev_id}/{rel_path}", text
+        yield from self.extra_files.items()
+
+    @property
+    def files(self):
+        return dict(self.iter_files())
+
+    def write(self, writer):
+        """
+        :param writer: The DirWriter or ArchiveWriter receiving the lab files.
+        """
+        for rel_path, text in self.iter_files():
+            writer.write(rel_path, text)
+
+    def _startup_params(self, dev_id, info):
+        """
+        The startup commands of a device in order, on one line: addresses
+        as is, for the interfaces in order, delays as <interface id>=<ms>,
+        and the other operations by name.
+        """
+        tokens = []
+        num_addrs = 0
+        for op, ifname, arg in info["startup_params"]:
+            if op in ("addr", "addr6"):
+                assert ifname == f"{self.if_name}{num_addrs}", (dev_id, ifname)
+                tokens.append(str(arg))
+                num_addrs += 1
+            elif op == "delay":
+                tokens.append(f"{ifname[len(self.if_name):]}={arg}")
+            else:
+                tokens.append(op)
+        return " ".join(tokens) + "\n"
+
+
 class KatharaLabGenerator(object):
 
     def __init__(self, args):
@@ -42,6 +139,7 @@ class KatharaLabGenerator(object):
         self.next_net_id = "0"
         self.alphabet = string.digits + string.ascii_lowercase
         self.link_br_ifids = {}
+        self.collision_domains = {}
 
         self.if_name = "net" if self.args.megalos else "eth"
     
@@ -55,14 +153,26 @@ class KatharaLabGenerator(object):
             self.next_net_id = self.next_net_id[:idx] + self.alphabet[self.alphabet.index(self.next_net_id[idx]) + 1] + self.next_net_id[idx + 1:]
 
     def generate_lab(self):
+        """
+        :returns: The generated KatharaLab.
+        """
         self._initiate_lab()
         self._assign_networks()
         self._add_container_images()
         self._add_commands()
-        self._write_lab()
+        if self.args.static_routes:
+            self._add_static_routes()
+        lab = KatharaLab(self.lab_conf, self.device_info, self.collision_domains,
+                         self.args.networks, self.args.shared_startup, self.if_name)
+        if self.args.bgp:
+            self._add_bgp(lab)
+        return lab
 
     def _initiate_lab(self):
-        self.lab_conf += f'LAB_DESCRIPTION="Caida to Kathará: {str(self.args.caida_config).split("/")[-1]}"\n'
+        if self.args.caida_config:
+            self.lab_conf += f'LAB_DESCRIPTION="Caida to Kathará: {str(self.args.caida_config).split("/")[-1]}"\n'
+        else:
+            self.lab_conf += f'LAB_DESCRIPTION="Caida to Kathará"\n'
         self.lab_conf += f'LAB_AUTHOR="ETH Zurich"\n'
         self.lab_conf += f'LAB_VERSION=1.0\n'
         self.lab_conf += f'LAB_WEB="http://example.com"\n'
@@ -77,6 +187,11 @@ class KatharaLabGenerator(object):
                 self._increment_net_id(len(self.next_net_id) - 1)   
             coll_domain = f"{self.net_ids[net]}"
             self.link_br_ifids[desc.name] = {}
+            self.collision_domains[coll_domain] = {
+                "network": net,
+                "link": desc.name,
+                "devices": self.link_br_ifids[desc.name],
+            }
             for br_name, ip in desc.ip_net.items():
                 if br_name not in self.devices_ifids:
                     self.devices_ifids[br_name] = 0
@@ -84,18 +199,19 @@ class KatharaLabGenerator(object):
                 gen_lines.append(f'{br_name}[{self.devices_ifids[br_name]}]="{coll_domain}"\n')
                 if br_name not in self.device_info:
                     self.device_info[br_name] = {
+                        "image": None,
+                        "interfaces": {},
                         "startup": "",
+                        "startup_params": [],
+                        "files": {},
                         "shutdown": "",
                     }
                 # Add IP addresses to startup script
-                if ip.version == 4:
-                    self.device_info[br_name][
-                        "startup"] += f'ip addr add {ip} dev {self.if_name}{self.devices_ifids[br_name]}\n'
-                else:
-                    self.device_info[br_name][
-                        "startup"] += f'ip -6 addr add {ip} dev {self.if_name}{self.devices_ifids[br_name]}\n'
-                    
+                op = "addr" if ip.version == 4 else "addr6"
+                self._add_startup_cmd(br_name, op, self.devices_ifids[br_name], ip)
+
                 self.link_br_ifids[desc.name][br_name] = self.devices_ifids[br_name]
+                self.device_info[br_name]["interfaces"][self.devices_ifids[br_name]] = coll_domain
 
                 self.devices_ifids[br_name] += 1
 
@@ -109,8 +225,10 @@ class KatharaLabGenerator(object):
         gen_lines = []
         for _, as_conf in self.args.caida_dicts.items():
             for br_name in as_conf["routers"].keys():
-                image = docker_image(self.args, 'base')
+                image = docker_image(self.args, 'frr' if self.args.bgp else 'base')
                 gen_lines.append(f'{br_name}[image]="{image}"\n')
+                if br_name in self.device_info:
+                    self.device_info[br_name]["image"] = image
 
         gen_lines.sort()
         for line in gen_lines:
@@ -127,8 +245,14 @@ class KatharaLabGenerator(object):
                 #self.device_info[br_name]["local_br"] += f'sleep 1s\n'
                 pass
 
+        # Local collision domains between co-located chassis get no delay.
+        chassis_lans = {str(sorted(names)) for as_conf in self.args.caida_dicts.values()
+                        for names in as_conf["chassis_groups"]}
         for _, desc in self.args.networks.items():
-            local_br, remote_br = ast.literal_eval(desc.name)
+            if desc.name in chassis_lans:
+                continue
+            brs = ast.literal_eval(desc.name)
+            local_br, remote_br = brs
             assert local_br != remote_br
             if not are_same_as(local_br, remote_br):
                 continue
@@ -142,16 +266,96 @@ class KatharaLabGenerator(object):
             self._add_delay_to_interface(remote_br, self.link_br_ifids[desc.name][remote_br], delay)
           
     def _add_delay_to_interface(self, br_name, if_id, delay):
-        self.device_info[br_name]["startup"] += f'tc qdisc add dev {self.if_name}{if_id} root netem delay {delay}ms\n'
+        self._add_startup_cmd(br_name, "delay", if_id, delay)
         #self.device_info[br_name]["shutdown"] += f'tc qdisc del dev {self.if_name}{if_id} root\n'
         pass 
 
-    def _write_lab(self):
-        write_file(os.path.join(self.args.output_dir, KATHARA_LAB_CONF), self.lab_conf)
-        for dev_id, info in self.device_info.items():
-            write_file(os.path.join(self.args.output_dir, f"{dev_id}.startup"), info["startup"])
-            if info["shutdown"]:
-                write_file(os.path.join(self.args.output_dir, f"{dev_id}.shutdown"), info["shutdown"])
+    def _add_static_routes(self):
+        """
+        Install the precomputed valley-free routes with one batched `ip`
+        invocation per device, reading the batch from its device directory.
+        """
+        # Static routing and BGP are optional, only import them when used.
+        from caida_kathara.routing import compute_static_routes
+        routes = compute_static_routes(self.args.caida_dicts, self.args.networks,
+                                       self.args.routing_workers)
+        for br_name, br_routes in routes:
+            if not br_routes:
+                continue
+            self.device_info[br_name]["files"][STATIC_ROUTES_FILE] = static_routes_batch(br_routes)
+            self._add_startup_cmd(br_name, "routes", None, "-")
+
+    def _add_bgp(self, lab):
+        """
+        Add the FRR configuration and start FRR on every device, and the
+        per-AS BGP session report to the lab.
+        """
+        from caida_kathara.bgp import (
+            BGP_REPORT_FILE,
+            FRR_CONF,
+            FRR_DAEMONS,
+            FRR_DAEMONS_CONF,
+            BGPConfigGenerator,
+        )
+        bgp_gen = BGPConfigGenerator(self.args, self.args.caida_dicts, self.args.networks)
+        for br_name, frr_conf in bgp_gen.generate().items():
+            self.device_info[br_name]["files"][FRR_CONF] = frr_conf
+            self.device_info[br_name]["files"][FRR_DAEMONS] = FRR_DAEMONS_CONF
+            self._add_startup_cmd(br_name, "frr", None, "-")
+        lab.extra_files[BGP_REPORT_FILE] = bgp_gen.report_json()
+
+    def _add_startup_cmd(self, br_name, op, if_id, arg):
+        """
+        Record a startup command both as a rendered line and as a row of the
+        per-device parameter table used by the shared startup template, so
+        both replay the commands in the same order.
+        """
+        ifname = f"{self.if_name}{if_id}" if if_id is not None else "-"
+        self.device_info[br_name]["startup_params"].append((op, ifname, arg))
+        self.device_info[br_name]["startup"] += STARTUP_CMDS[op].format(ifname=ifname, arg=arg) + '\n'
+
+
+def static_routes_batch(routes):
+    """
+    Render (subnet, next hop) routes as `ip -batch` input.
+    """
+    return "".join(STATIC_ROUTE_CMD.format(net=net, via=via) + "\n" for net, via in routes)
+
+
+def shared_startup_template(if_name="eth"):
+    """
+    Render the shared startup script. Each device reads its parameters from
+    its own device directory, which Kathara copies into that device only,
+    and replays them through the same STARTUP_CMDS templates used for
+    per-device startup files, in the same order.
+    """
+    # Token pattern and shell assignments of ifname and arg, per operation,
+    # in matching order: IPv6 addresses before IPv4 ones.
+    parsers = {
+        "addr6": ('*:*/*', f'ifname={if_name}$i; arg=$tok; i=$((i + 1))'),
+        "addr": ('*/*', f'ifname={if_name}$i; arg=$tok; i=$((i + 1))'),
+        "delay": ('*=*', f'ifname={if_name}${{tok%%=*}}; arg=${{tok#*=}}'),
+    }
+    cases = ""
+    for op in list(parsers) + [op for op in STARTUP_CMDS if op not in parsers]:
+        pattern, assign = parsers.get(op, (op, None))
+        cmd = STARTUP_CMDS[op].format(ifname="${ifname}", arg="${arg}")
+        cases += f'        {pattern}) {assign + "; " if assign else ""}{cmd} ;;\n'
+    return (
+        '#!/bin/sh\n'
+        'set -f\n'
+        f'if [ ! -r /{STARTUP_PARAMS_FILE} ]; then\n'
+        f'    echo "{KATHARA_SHARED_STARTUP}: missing /{STARTUP_PARAMS_FILE} on $(hostname)" >&2\n'
+        '    exit 1\n'
+        'fi\n'
+        'i=0\n'
+        f'for tok in $(cat /{STARTUP_PARAMS_FILE}); do\n'
+        '    case "$tok" in\n'
+        f'{cases}'
+        '    esac\n'
+        'done\n'
+    )
+
 
 def are_same_as(br1, br2):
     return br1.split("_")[0] == br2.split("_")[0]
\ No newline at end of file
@@ -0,0 +1,249 @@
+"""
+:mod:`launch` --- Parallel Kathara lab launcher
+=============================================
+"""
+# Stdlib
+import abc
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+from caida_kathara.common import ArgsBase
+from caida_kathara.kathara import KATHARA_LAB_CONF
+
+LAUNCH_REPORT_FILE = 'launch_report.json'
+
+WAVE_BY_AS = 'as'
+WAVE_BY_PARTITION = 'partition'
+
+_DEVICE_LINE = re.compile(r'^([^\s\[=#]+)\[')
+_BR_NAME = re.compile(r'^br(\d+)_(\d+)')
+
+
+class LaunchArgs(ArgsBase):
+    pass
+
+
+def check_arguments(args):
+    """
+    Reject invalid option values before any device is started.
+
+    :raises ValueError: With the reason, for parser.error or API callers.
+    """
+    if args.concurrency < 1:
+        raise ValueError("--concurrency must be at least 1")
+    if args.wave_size < 1:
+        raise ValueError("--wave-size must be at least 1")
+    if args.retries < 0:
+        raise ValueError("--retries must not be negative")
+    if args.retry_delay < 0:
+        raise ValueError("--retry-delay must not be negative")
+    return args
+
+
+class LaunchBackend(abc.ABC):
+    """
+    Starts single devices of a lab. Implementations raise an exception if the
+    device could not be started.
+    """
+
+    def prepare(self, lab_dir, devices):
+        """
+        Called once before the first wave.
+
+        :param str lab_dir: Lab directory.
+        :param list devices: All devices that will be started.
+        """
+
+    @abc.abstractmethod
+    def start(self, lab_dir, device):
+        pass
+
+    def cleanup(self, lab_dir, device):
+        """
+        Called after a failed start, before the device is retried, to remove
+        whatever the failed attempt left behind.
+        """
+
+
+class KatharaBackend(LaunchBackend):
+    """
+    Starts the devices through the Kathara Python API. The lab.conf is parsed
+    once and the collision domains of all devices are created before the
+    first wave, so the devices of a wave do not race on shared ones.
+    """
+
+    def __init__(self):
+        self.manager = None
+        self.lab = None
+
+    def prepare(self, lab_dir, devices):
+        # Optional dependency, only needed to start the lab.
+        try:
+            from Kathara.manager.Kathara import Kathara
+            from Kathara.parser.netkit.LabParser import LabParser
+        except ImportError:
+            logging.critical("The kathara package is required to launch '%s'", lab_dir)
+            sys.exit(1)
+        self.manager = Kathara.get_instance()
+        self.lab = LabParser.parse(lab_dir)
+        self.lab.check_integrity()
+        links = [self.lab.links[name] for name in sorted(self.lab.get_links_from_machines(devices))]
+        logging.info("Creating %d collision domains", len(links))
+        with ThreadPoolExecutor() as pool:
+            # list() re-raises the first failure.
+            list(pool.map(self.manager.deploy_link, links))
+
+    def start(self, lab_dir, device):
+        self.manager.deploy_machine(self.lab.get_machine(device))
+
+    def cleanup(self, lab_dir, device):
+        # A container left by a failed start makes the next deploy fail
+        # with MachineAlreadyExistsError.
+        self.manager.undeploy_machine(self.lab.get_machine(device))
+
+
+class MockBackend(LaunchBackend):
+    """
+    Backend that does not start anything, to exercise the launcher without
+    Docker. Devices in `failures` fail that many times before succeeding.
+    Like Kathara, a failed start leaves the device deployed and starting it
+    again fails until it is cleaned up.
+    """
+
+    def __init__(self, boot_time=0.0, failures=None):
+        self.boot_time = boot_time
+        self.failures = dict(failures or {})
+        self.started = []
+        self.deployed = set()
+
+    def start(self, lab_dir, device):
+        time.sleep(self.boot_time)
+        if device in self.deployed:
+            raise RuntimeError("mock device %s already exists" % device)
+        self.deployed.add(device)
+        if self.failures.get(device, 0) > 0:
+            self.failures[device] -= 1
+            raise RuntimeError("mock failure for %s" % device)
+        self.started.append(device)
+
+    def cleanup(self, lab_dir, device):
+        self.deployed.discard(device)
+
+
+BACKENDS = {
+    'kathara': KatharaBackend,
+    'mock': MockBackend,
+}
+
+
+class Launcher(object):
+    def __init__(self, args, backend=None):
+        """
+        :param LaunchArgs args: Contains the passed command line arguments.
+        :param LaunchBackend backend: Overrides the backend selected in args.
+        """
+        self.args = args
+        self.backend = backend or BACKENDS[self.args.backend]()
+        self.report = {}
+
+    def launch(self):
+        """
+        Start all devices of the lab wave by wave and write the boot report.
+
+        :returns: True if every device was started.
+        """
+        devices = read_lab_devices(self.args.lab_dir)
+        waves = self._waves(devices)
+        start = time.monotonic()
+        self.backend.prepare(self.args.lab_dir, devices)
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            for wave_id, wave in enumerate(waves):
+                logging.info("Starting wave %d/%d (%d devices)",
+                             wave_id + 1, len(waves), len(wave))
+                for device, result in zip(wave, pool.map(self._start_device, wave)):
+                    result["wave"] = wave_id
+                    self.report[device] = result
+        failed = sorted(dev for dev, res in self.report.items() if not res["ok"])
+        summary = {
+            "total_time": time.monotonic() - start,
+            "waves": len(waves),
+            "failed": failed,
+            "devices": self.report,
+        }
+        with open(self._report_path(), 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        if failed:
+            logging.error("%d devices failed to start: %s", len(failed), ", ".join(failed))
+        return not failed
+
+    def _waves(self, devices):
+        size = self.args.wave_size
+        if self.args.wave_by == WAVE_BY_PARTITION:
+            return [devices[i:i + size] for i in range(0, len(devices), size)]
+        # Pack whole ASes into waves, so the routers of an AS boot together.
+        waves = [[]]
+        for _, as_devices in groupby(devices, key=lambda d: device_sort_key(d)[0]):
+            as_devices = list(as_devices)
+            if waves[-1] and len(waves[-1]) + len(as_devices) > size:
+                waves.append([])
+            waves[-1].extend(as_devices)
+        return [wave for wave in waves if wave]
+
+    def _start_device(self, device):
+        result = {"ok": False, "attempts": 0, "boot_time": None, "error": None}
+        for attempt in range(self.args.retries + 1):
+            result["attempts"] = attempt + 1
+            start = time.monotonic()
+            try:
+                self.backend.start(self.args.lab_dir, device)
+            except Exception as e:
+                result["error"] = _error_str(e)
+                logging.warning("Starting %s failed (attempt %d): %s",
+                                device, attempt + 1, result["error"])
+                if attempt < self.args.retries:
+                    self._cleanup_device(device)
+                    time.sleep(self.args.retry_delay * (attempt + 1))
+                continue
+            result.update(ok=True, boot_time=time.monotonic() - start, error=None)
+            break
+        return result
+
+    def _cleanup_device(self, device):
+        try:
+            self.backend.cleanup(self.args.lab_dir, device)
+        except Exception as e:
+            logging.warning("Cleaning up %s failed: %s", device, _error_str(e))
+
+    def _report_path(self):
+        return self.args.report or os.path.join(self.args.lab_dir, LAUNCH_REPORT_FILE)
+
+
+def read_lab_devices(lab_dir):
+    """
+    Return the devices declared in the lab.conf of lab_dir, ordered by AS and
+    router number.
+    """
+    devices = set()
+    with open(os.path.join(lab_dir, KATHARA_LAB_CONF)) as f:
+        for line in f:
+            match = _DEVICE_LINE.match(line)
+            if match:
+                devices.add(match.group(1))
+    return sorted(devices, key=device_sort_key)
+
+
+def device_sort_key(device):
+    match = _BR_NAME.match(device)
+    if not match:
+        return (-1, 0, device)
+    return (int(match.group(1)), int(match.group(2)), device)
+
+
+def _error_str(e):
+    return str(e) or type(e).__name__
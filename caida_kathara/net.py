@@ -33,9 +33,6 @@ from ipaddress import (
 )
 from typing import Mapping, Union
 
-# External packages
-import yaml
-
 # SCION
 from caida_kathara.defines import DEFAULT_NETWORK, DEFAULT_SCN_DC_NETWORK, DEFAULT6_NETWORK_ADDR
 
@@ -50,9 +47,7 @@ class NetworkDescription(object):
         self.ip_net = ip_net
 
 
-class AddressProxy(yaml.YAMLObject):
-    yaml_tag = ""
-
+class AddressProxy(object):
     def __init__(self):
         self._intf = None
         self.ip = None
@@ -64,10 +59,6 @@ class AddressProxy(yaml.YAMLObject):
     def __str__(self):
         return str(self._intf)
 
-    @classmethod
-    def to_yaml(cls, dumper, inst):
-        return dumper.represent_scalar('tag:yaml.org,2002:str', str(inst.ip))
-
 
 class AddressGenerator(object):
     def __init__(self):
@@ -101,6 +92,9 @@ class SubnetGenerator(object):
             sys.exit(1)
         self._subnets = defaultdict(lambda: AddressGenerator()) \
             # type: Mapping[str, AddressGenerator]
+        self._groups = {}
+        #: Block of every group, filled by alloc_subnets
+        self.group_blocks = {}  # type: Mapping[object, IPNetwork]
         self._allocations = defaultdict(list)
         # Initialise the allocations with the supplied network, making sure to
         # exclude 127.0.0.0/30 (for v4) and DEFAULT6_NETWORK_ADDR/126 (for v6)
@@ -114,49 +108,71 @@ class SubnetGenerator(object):
             exclude = ip_network(DEFAULT6_NETWORK_ADDR + "/126")
 
         if self._net.overlaps(exclude):
-            self._exclude_net(self._net, exclude)
+            self._exclude_net(self._allocations, self._net, exclude)
             return
 
         self._allocations[self._net.prefixlen].append(self._net)
 
-    def register(self, location: str) -> AddressGenerator:
+    def register(self, location: str, group=None) -> AddressGenerator:
+        """
+        :param group: Subnets of the same group are allocated from one
+            block, so a single prefix covers all of them.
+        """
+        if group is not None:
+            self._groups[location] = group
         return self._subnets[location]
 
     def alloc_subnets(self) -> Mapping[IPNetwork, NetworkDescription]:
         max_prefix = self._net.max_prefixlen
         networks = {}
+        grouped = defaultdict(list)
         for topo, subnet in sorted(self._subnets.items(), key=lambda x: str(x)):
-            # Figure out what size subnet we need. If it's a link, then we just
-            # need a /31 (or /127), otherwise add 2 to the subnet size to cover
-            # the network and broadcast addresses.
-            if len(subnet) == 2:
-                req_prefix = max_prefix - 1
-            else:
-                req_prefix = max_prefix - math.ceil(math.log2(len(subnet) + 2))
-
-            # Search all subnets from that size upwards
-            for prefix in range(req_prefix, -1, -1):
-                if not self._allocations[prefix]:
-                    # No subnets available at this size
-                    continue
-                alloc = self._allocations[prefix].pop()
-                # Carve out subnet of the required size
-                new_net = next(alloc.subnets(new_prefix=req_prefix))
-                new_net = _workaround_ip_network_hosts_py35(new_net)
-                logging.debug("Allocating %s from %s for subnet size %d" %
-                              (new_net, alloc, len(subnet)))
+            grouped[self._groups.get(topo)].append((topo, subnet))
+        for group, subnets in sorted((g, s) for g, s in grouped.items() if g is not None):
+            # Blocks are only split, never freed, so the power of two sized
+            # subnets always fit in a block of their total size.
+            size = sum(2 ** (max_prefix - self._req_prefix(subnet)) for _, subnet in subnets)
+            block = self._alloc(self._allocations, max_prefix - math.ceil(math.log2(size)))
+            self.group_blocks[group] = block
+            allocations = defaultdict(list)
+            allocations[block.prefixlen].append(block)
+            for topo, subnet in subnets:
+                new_net = self._alloc(allocations, self._req_prefix(subnet))
                 networks[new_net] = NetworkDescription(topo, subnet.alloc_addrs(new_net))
-                # Repopulate the allocations list with the left-over space
-                self._exclude_net(alloc, new_net)
-                break
-            else:
-                logging.critical("Unable to allocate /%d subnet" % req_prefix)
-                sys.exit(1)
+        for topo, subnet in grouped[None]:
+            new_net = self._alloc(self._allocations, self._req_prefix(subnet))
+            networks[new_net] = NetworkDescription(topo, subnet.alloc_addrs(new_net))
         return networks
 
-    def _exclude_net(self, alloc, net):
+    def _req_prefix(self, subnet):
+        # Figure out what size subnet we need. If it's a link, then we just
+        # need a /31 (or /127), otherwise add 2 to the subnet size to cover
+        # the network and broadcast addresses.
+        max_prefix = self._net.max_prefixlen
+        if len(subnet) == 2:
+            return max_prefix - 1
+        return max_prefix - math.ceil(math.log2(len(subnet) + 2))
+
+    def _alloc(self, allocations, req_prefix):
+        # Search all subnets from that size upwards
+        for prefix in range(req_prefix, -1, -1):
+            if not allocations[prefix]:
+                # No subnets available at this size
+                continue
+            alloc = allocations[prefix].pop()
+            # Carve out subnet of the required size
+            new_net = next(alloc.subnets(new_prefix=req_prefix))
+            new_net = _workaround_ip_network_hosts_py35(new_net)
+            logging.debug("Allocating %s from %s" % (new_net, alloc))
+            # Repopulate the allocations list with the left-over space
+            self._exclude_net(allocations, alloc, new_net)
+            return new_net
+        logging.critical("Unable to allocate /%d subnet" % req_prefix)
+        sys.exit(1)
+
+    def _exclude_net(self, allocations, alloc, net):
         for net in alloc.address_exclude(net):
-            self._allocations[net.prefixlen].append(net)
+            allocations[net.prefixlen].append(net)
 
 
 def socket_address_str(ip: IPAddress, port: int) -> str:
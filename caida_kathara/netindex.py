@@ -0,0 +1,277 @@
+"""
+:mod:`netindex` --- Indexed binary companion of networks.conf
+=============================================
+A compact file mapping subnets to links, devices and interfaces. It is made of
+sorted fixed-width tables, so lookups are binary searches over a memory map
+and never load the whole file.
+
+Layout (little endian), all sections following each other:
+
+- header: magic, format version, address width and the size of every section
+- segments: (version, prefix length, first subnet, count), one per prefix
+  length, ordered by version and decreasing prefix length
+- subnets: network address, version, prefix length and members, sorted by
+  segment and network address
+- interfaces: address, version, interface id, device and subnet, sorted by
+  version and address
+- devices: name and interfaces, sorted by name
+- subnet members and device interfaces: interface indices
+- strings: UTF-8 names, starting with the interface name prefix
+
+Addresses take 4 bytes in IPv4 labs and 16 bytes otherwise. Links are not
+stored: a link is named after the sorted devices of its subnet.
+"""
+# Stdlib
+import struct
+from collections import namedtuple
+from ipaddress import IPv4Address, IPv6Address, ip_address, ip_network
+
+MAGIC = b'CKNI'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sHBB6I')
+_SEGMENT = struct.Struct('<BBxxII')
+_DEVICE = struct.Struct('<IHxxII')
+_INDEX = struct.Struct('<I')
+
+
+def _subnet_struct(width):
+    return struct.Struct('<%dsBBxxII' % width)
+
+
+def _iface_struct(width):
+    return struct.Struct('<%dsBxHII' % width)
+
+IndexedSubnet = namedtuple('IndexedSubnet', ['network', 'link', 'interfaces'])
+IndexedInterface = namedtuple('IndexedInterface', ['device', 'ifname', 'address', 'network', 'link'])
+
+
+def build_networks_index(lab) -> bytes:
+    """
+    Serialize the networks of a generated lab.
+
+    :param KatharaLab lab: The generated lab.
+    """
+    strings = bytearray(lab.if_name.encode())
+
+    def add_string(s):
+        data = s.encode()
+        strings.extend(data)
+        return len(strings) - len(data), len(data)
+
+    devices = sorted(lab.devices, key=lambda d: d.encode())
+    device_ids = {dev: i for i, dev in enumerate(devices)}
+
+    subnets = sorted(lab.collision_domains.values(),
+                     key=lambda cd: (cd["network"].version, -cd["network"].prefixlen,
+                                     cd["network"].network_address))
+    ifaces = []
+    for subnet_id, cd in enumerate(subnets):
+        ip_net = lab.networks[cd["network"]].ip_net
+        for dev, if_id in sorted(cd["devices"].items()):
+            ifaces.append((ip_net[dev].ip, if_id, device_ids[dev], subnet_id))
+    ifaces.sort(key=lambda x: (x[0].version, x[0]))
+    width = 16 if any(cd["network"].version == 6 for cd in subnets) else 4
+    subnet_struct, iface_struct = _subnet_struct(width), _iface_struct(width)
+
+    segments = []
+    for subnet_id, cd in enumerate(subnets):
+        key = (cd["network"].version, cd["network"].prefixlen)
+        if segments and tuple(segments[-1][:2]) == key:
+            segments[-1][3] += 1
+        else:
+            segments.append([key[0], key[1], subnet_id, 1])
+
+    subnet_members = [[] for _ in subnets]
+    device_ifaces = [[] for _ in devices]
+    for iface_id, (_, if_id, dev_id, subnet_id) in enumerate(ifaces):
+        subnet_members[subnet_id].append(iface_id)
+        device_ifaces[dev_id].append((if_id, iface_id))
+
+    out = bytearray()
+    member_start = 0
+    subnet_data = bytearray()
+    for subnet_id, cd in enumerate(subnets):
+        net = cd["network"]
+        subnet_data += subnet_struct.pack(_addr_bytes(net.network_address, width), net.version,
+                                          net.prefixlen, member_start,
+                                          len(subnet_members[subnet_id]))
+        member_start += len(subnet_members[subnet_id])
+    iface_data = bytearray()
+    for ip, if_id, dev_id, subnet_id in ifaces:
+        iface_data += iface_struct.pack(_addr_bytes(ip, width), ip.version, if_id, dev_id,
+                                        subnet_id)
+    device_data = bytearray()
+    iface_start = 0
+    for dev_id, dev in enumerate(devices):
+        off, length = add_string(dev)
+        device_data += _DEVICE.pack(off, length, iface_start, len(device_ifaces[dev_id]))
+        iface_start += len(device_ifaces[dev_id])
+
+    out += _HEADER.pack(MAGIC, FORMAT_VERSION, width, len(lab.if_name), len(segments),
+                        len(subnets), len(ifaces), len(devices), len(strings), 0)
+    for segment in segments:
+        out += _SEGMENT.pack(*segment)
+    out += subnet_data + iface_data + device_data
+    indices = [iface_id for members in subnet_members for iface_id in members]
+    indices += [iface_id for dev_ifaces in device_ifaces for _, iface_id in sorted(dev_ifaces)]
+    out += struct.pack('<%dI' % len(indices), *indices)
+    out += strings
+    return bytes(out)
+
+
+class NetworksIndex(object):
+    """
+    Read-only view of a networks index. Use NetworksIndex.open() to memory map
+    a file, or pass the serialized bytes directly.
+    """
+
+    def __init__(self, buf):
+        self._buf = buf
+        (magic, version, width, if_name_len, n_segments, n_subnets, n_ifaces, n_devices,
+         _, _) = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("not a networks index (version %d)" % FORMAT_VERSION)
+        self._width = width
+        self._subnet_struct = _subnet_struct(width)
+        self._iface_struct = _iface_struct(width)
+        self._n_subnets = n_subnets
+        self._n_ifaces = n_ifaces
+        self._n_devices = n_devices
+        self._segments_off = _HEADER.size
+        self._subnets_off = self._segments_off + n_segments * _SEGMENT.size
+        self._ifaces_off = self._subnets_off + n_subnets * self._subnet_struct.size
+        self._devices_off = self._ifaces_off + n_ifaces * self._iface_struct.size
+        self._members_off = self._devices_off + n_devices * _DEVICE.size
+        self._dev_ifaces_off = self._members_off + n_ifaces * _INDEX.size
+        self._strings_off = self._dev_ifaces_off + n_ifaces * _INDEX.size
+        self._segments = [_SEGMENT.unpack_from(buf, self._segments_off + i * _SEGMENT.size)
+                          for i in range(n_segments)]
+        self.if_name = self._string(0, if_name_len)
+
+    @classmethod
+    def open(cls, path):
+        import mmap
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        if hasattr(self._buf, 'close'):
+            self._buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, addr):
+        """
+        Longest-prefix match of an address.
+
+        :returns: The IndexedSubnet containing addr, or None.
+        """
+        ip = ip_address(addr)
+        for version, prefixlen, start, count in self._segments:
+            if version != ip.version:
+                continue
+            net = ip_network("%s/%d" % (ip, prefixlen), strict=False)
+            key = _addr_bytes(net.network_address, self._width)
+            idx = _bisect(lambda i: self._subnet(i)[0], key, start, start + count)
+            if idx is not None:
+                return self._indexed_subnet(idx)
+        return None
+
+    def interface(self, addr):
+        """
+        :returns: The IndexedInterface with address addr, or None.
+        """
+        ip = ip_address(addr)
+        if ip.max_prefixlen // 8 > self._width:
+            return None
+        key = (ip.version, _addr_bytes(ip, self._width))
+        idx = _bisect(lambda i: self._iface(i)[:2], key, 0, self._n_ifaces)
+        if idx is None:
+            return None
+        return self._indexed_iface(idx)
+
+    def device_interfaces(self, device):
+        """
+        :returns: The IndexedInterfaces of a device ordered by interface id.
+        """
+        key = device.encode()
+        idx = _bisect(lambda i: self._device_name(i), key, 0, self._n_devices)
+        if idx is None:
+            return []
+        _, _, start, count = _DEVICE.unpack_from(self._buf, self._devices_off + idx * _DEVICE.size)
+        return [self._indexed_iface(self._index(self._dev_ifaces_off, i))
+                for i in range(start, start + count)]
+
+    def _subnet(self, idx):
+        return self._subnet_struct.unpack_from(
+            self._buf, self._subnets_off + idx * self._subnet_struct.size)
+
+    def _iface(self, idx):
+        addr, version, if_id, dev_id, subnet_id = self._iface_struct.unpack_from(
+            self._buf, self._ifaces_off + idx * self._iface_struct.size)
+        return version, addr, if_id, dev_id, subnet_id
+
+    def _device_name(self, idx):
+        off, length, _, _ = _DEVICE.unpack_from(self._buf, self._devices_off + idx * _DEVICE.size)
+        return bytes(self._buf[self._strings_off + off:self._strings_off + off + length])
+
+    def _string(self, off, length):
+        return bytes(self._buf[self._strings_off + off:self._strings_off + off + length]).decode()
+
+    def _index(self, table_off, i):
+        return _INDEX.unpack_from(self._buf, table_off + i * _INDEX.size)[0]
+
+    def _network(self, idx):
+        addr, version, prefixlen, _, _ = self._subnet(idx)
+        return ip_network("%s/%d" % (_bytes_addr(addr, version), prefixlen))
+
+    def _link(self, idx):
+        _, _, _, start, count = self._subnet(idx)
+        return sorted(self._device_name(self._iface(self._index(self._members_off, i))[3]).decode()
+                      for i in range(start, start + count))
+
+    def _indexed_subnet(self, idx):
+        _, _, _, start, count = self._subnet(idx)
+        network, link = self._network(idx), self._link(idx)
+        members = [self._indexed_iface(self._index(self._members_off, i), network, link)
+                   for i in range(start, start + count)]
+        return IndexedSubnet(network, link, members)
+
+    def _indexed_iface(self, idx, network=None, link=None):
+        version, addr, if_id, dev_id, subnet_id = self._iface(idx)
+        return IndexedInterface(self._device_name(dev_id).decode(), "%s%d" % (self.if_name, if_id),
+                                _bytes_addr(addr, version),
+                                network or self._network(subnet_id),
+                                link or self._link(subnet_id))
+
+
+def _addr_bytes(ip, width):
+    return int(ip).to_bytes(width, 'big')
+
+
+def _bytes_addr(data, version):
+    value = int.from_bytes(data, 'big')
+    return IPv6Address(value) if version == 6 else IPv4Address(value)
+
+
+def _bisect(key_at, key, lo, hi):
+    """
+    Binary search for key in the sorted range [lo, hi) of a table.
+
+    :returns: The index of the matching entry, or None.
+    """
+    while lo < hi:
+        mid = (lo + hi) // 2
+        mid_key = key_at(mid)
+        if mid_key < key:
+            lo = mid + 1
+        elif mid_key > key:
+            hi = mid
+        else:
+            return mid
+    return None
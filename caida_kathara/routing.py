@@ -0,0 +1,323 @@
+"""
+:mod:`routing` --- Precomputed valley-free static routing
+=============================================
+Computes the Gao-Rexford best path of every AS towards every other AS and
+turns them into static routes for the border routers, as an alternative to
+letting a routing daemon converge inside the lab.
+
+Route preference follows the usual policy: routes learned from customers are
+preferred over routes from peers, which are preferred over routes from
+providers, then shorter AS paths win and ties go to the lowest next-hop AS.
+Routes from peers and providers are only exported to customers.
+"""
+# Stdlib
+import ast
+import logging
+import os
+import time
+from collections import defaultdict
+from ipaddress import ip_network
+from itertools import permutations
+
+from caida_kathara.common import LinkRel
+from caida_kathara.util import calculate_great_circle_latency
+
+# AS graph shared with the worker processes
+_graph = None
+
+
+class ASGraph(object):
+    def __init__(self, relationships):
+        """
+        :param dict relationships: AS id to a dict of neighbor AS id to the
+            LinkRel of the neighbor, as found in the topo dicts.
+        """
+        self.as_ids = sorted(set(relationships) |
+                             {n for rels in relationships.values() for n in rels})
+        index = {as_id: i for i, as_id in enumerate(self.as_ids)}
+        self.customers = [[] for _ in self.as_ids]
+        self.providers = [[] for _ in self.as_ids]
+        self.peers = [[] for _ in self.as_ids]
+        for as_id, rels in relationships.items():
+            for neighbor, rel in rels.items():
+                i, j = index[as_id], index[neighbor]
+                if rel == LinkRel.CUSTOMER:
+                    self.customers[i].append(j)
+                elif rel == LinkRel.PROVIDER:
+                    self.providers[i].append(j)
+                else:
+                    # Inter-AS siblings are treated as peers.
+                    self.peers[i].append(j)
+        for adj in (self.customers, self.providers, self.peers):
+            for neighbors in adj:
+                neighbors.sort()
+
+    def best_paths(self, dest):
+        """
+        Valley-free best paths of all ASes towards the AS with index dest, in
+        three BFS phases: customer routes climbing provider links, peer routes
+        one hop sideways, and provider routes descending customer links.
+
+        :returns: The next-hop AS index and AS path length of every AS, -1
+            where there is no valley-free path.
+        """
+        next_hop = [-1] * len(self.as_ids)
+        length = [-1] * len(self.as_ids)
+        next_hop[dest] = dest
+        length[dest] = 0
+        # Customer routes
+        frontier = [dest]
+        while frontier:
+            reached = []
+            for u in frontier:
+                for p in self.providers[u]:
+                    if length[p] < 0:
+                        length[p] = length[u] + 1
+                        next_hop[p] = u
+                        reached.append(p)
+            frontier = sorted(reached)
+        customer_routed = sorted((i for i in range(len(length)) if length[i] >= 0),
+                                 key=lambda i: (length[i], i))
+        # Peer routes, only from ASes with customer routes
+        peer_routes = {}
+        for u in customer_routed:
+            for q in self.peers[u]:
+                if length[q] < 0 and q not in peer_routes:
+                    peer_routes[q] = u
+        for q, u in peer_routes.items():
+            length[q] = length[u] + 1
+            next_hop[q] = u
+        # Provider routes, exported by every routed AS to its customers
+        buckets = defaultdict(list)
+        for i in range(len(length)):
+            if length[i] >= 0:
+                buckets[length[i]].append(i)
+        level = 0
+        while level <= max(buckets, default=-1):
+            for u in sorted(buckets.pop(level, ())):
+                for c in self.customers[u]:
+                    if length[c] < 0:
+                        length[c] = level + 1
+                        next_hop[c] = u
+                        buckets[level + 1].append(c)
+            level += 1
+        return next_hop, length
+
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph
+
+
+def _best_paths(dests):
+    return [(dest, _graph.best_paths(dest)) for dest in dests]
+
+
+def valley_free_paths(graph, workers=None):
+    """
+    Compute the best paths towards every AS, one BFS per destination, spread
+    over worker processes.
+
+    :param int workers: Number of worker processes, the CPU count if None.
+    :returns: List indexed by destination AS index of (next_hop, length).
+    """
+    dests = list(range(len(graph.as_ids)))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(dests) < 64:
+        return [graph.best_paths(dest) for dest in dests]
+    # The process pool pulls in multiprocessing, only import it when needed.
+    from concurrent.futures import ProcessPoolExecutor
+    chunk = max(1, len(dests) // (workers * 8) + 1)
+    chunks = [dests[i:i + chunk] for i in range(0, len(dests), chunk)]
+    paths = [None] * len(dests)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(graph,)) as pool:
+        for results in pool.map(_best_paths, chunks):
+            for dest, res in results:
+                paths[dest] = res
+    return paths
+
+
+def compute_static_routes(caida_dicts, networks, workers=None):
+    """
+    Compute the static routes of the border routers, AS by AS: one route per
+    subnet of their own AS they are not directly connected to, and one route
+    per other AS towards its address block.
+
+    :param dict caida_dicts: The generated topo dicts from TopoGenerator,
+        with the address block of every AS.
+    :param dict networks: The generated networks from SubnetGenerator.
+    :param int workers: Number of worker processes for the path computation,
+        the CPU count if None.
+    :returns: Generator of (router name, list of (subnet, next-hop address)
+        strings), the routers of one AS at a time.
+    """
+    start = time.monotonic()
+    graph = ASGraph({as_id: as_conf.get("relationships", {})
+                     for as_id, as_conf in caida_dicts.items()})
+    paths = valley_free_paths(graph, workers)
+    path_time = time.monotonic() - start
+    as_index = {as_id: i for i, as_id in enumerate(graph.as_ids)}
+
+    router_as = {}
+    block_as = {}
+    for as_id, as_conf in caida_dicts.items():
+        for br in as_conf["routers"]:
+            router_as[br] = as_id
+        if as_conf["prefix"] is not None:
+            block_as[as_conf["prefix"]] = as_id
+    block_lens = sorted({block.prefixlen for block in block_as})
+    blocks = [(str(block), dest_as) for block, dest_as in sorted(block_as.items(),
+                                                                 key=lambda x: x[1])]
+    # Next-hop address of every directly connected router pair, the routers
+    # of each AS that connect to each neighbor AS, the adjacencies inside
+    # each AS (full mesh links and the collision domains of split routers)
+    # and the subnets in the address block of each AS.
+    link_ip = {}
+    as_subnets = defaultdict(list)
+    exits = defaultdict(lambda: defaultdict(set))
+    intra_adj = defaultdict(set)
+    for net, desc in networks.items():
+        brs = ast.literal_eval(desc.name)
+        for br1, br2 in permutations(brs, 2):
+            link_ip[(br1, br2)] = str(desc.ip_net[br2].ip)
+            if router_as[br1] != router_as[br2]:
+                exits[router_as[br1]][router_as[br2]].add(br1)
+            else:
+                intra_adj[br1].add(br2)
+        for prefixlen in block_lens:
+            block = net.supernet(new_prefix=prefixlen) if prefixlen <= net.prefixlen else None
+            if block in block_as:
+                as_subnets[block_as[block]].append((str(net), brs))
+                break
+
+    num_routes = 0
+    sizes = None
+    unreachable = 0
+    for as_id, as_conf in caida_dicts.items():
+        routers = sorted(as_conf["routers"])
+        hops = {br: _first_hops(br, intra_adj) for br in routers}
+        a = as_index[as_id]
+        routes = {br: [] for br in routers}
+        for net, brs in as_subnets[as_id]:
+            # Forward towards the closest local endpoint.
+            local = [br for br in brs if router_as[br] == as_id]
+            for br in routers:
+                if br not in brs:
+                    target = min(local, key=lambda t: (hops[br][t][0], t))
+                    routes[br].append((net, link_ip[(br, hops[br][target][1])]))
+        next_hop_ips = {}
+        for block, dest_as in blocks:
+            if dest_as == as_id:
+                continue
+            t = as_index[dest_as]
+            if paths[t][1][a] < 0:
+                unreachable += 1
+                continue
+            next_as = graph.as_ids[paths[t][0][a]]
+            if next_as not in next_hop_ips:
+                next_hop_ips[next_as] = {
+                    br: link_ip[(br, _exit_hop(br, as_conf, exits[as_id][next_as],
+                                               next_as, router_as, hops[br]))]
+                    for br in routers}
+            for br in routers:
+                routes[br].append((block, next_hop_ips[next_as][br]))
+        for br in routers:
+            size = len(routes[br])
+            num_routes += size
+            sizes = (min(sizes[0], size), max(sizes[1], size)) if sizes else (size, size)
+            yield br, routes.pop(br)
+
+    sizes = sizes or (0, 0)
+    logging.info("Static routing: paths computed in %.2fs, routes in %.2fs; "
+                 "%d routes, %d-%d per router (avg %.0f), %d unreachable AS pairs",
+                 path_time, time.monotonic() - start - path_time, num_routes,
+                 sizes[0], sizes[1], num_routes / max(1, len(router_as)), unreachable)
+
+
+def _first_hops(src, adj):
+    """
+    BFS inside an AS from src.
+
+    :returns: Router to (hop count, first hop from src) of every reachable router.
+    """
+    hops = {src: (0, src)}
+    frontier = [src]
+    while frontier:
+        reached = []
+        for u in frontier:
+            for v in sorted(adj[u]):
+                if v not in hops:
+                    hops[v] = (hops[u][0] + 1, v if u == src else hops[u][1])
+                    reached.append(v)
+        frontier = reached
+    return hops
+
+
+def _exit_hop(br, as_conf, exit_brs, next_as, router_as, hops):
+    """
+    The router br forwards to towards next_as: a directly connected router
+    of next_as if there is one, otherwise the first hop towards the local
+    exit router with the fewest hops, the nearest one among those.
+
+    The hop count to the chosen exit drops at every router on the way, so
+    the routers of a split AS cannot forward to each other in a loop.
+    """
+    remote = sorted(r for r in as_conf["routers"][br]
+                    if r in router_as and router_as[r] == next_as)
+    if remote:
+        return remote[0]
+    lat, long = as_conf["routers"][br]["latitude"], as_conf["routers"][br]["longitude"]
+    exit_br = min(exit_brs, key=lambda e: (hops[e][0], calculate_great_circle_latency(
+        lat, long, as_conf["routers"][e]["latitude"], as_conf["routers"][e]["longitude"]), e))
+    return hops[exit_br][1]
+
+
+def find_route_loops(routes, networks):
+    """
+    Follow the static routes of every router towards every subnet, by
+    longest prefix match.
+
+    :param dict routes: Router name to a list of (subnet, next-hop address)
+        strings, as yielded by compute_static_routes.
+    :param dict networks: The generated networks from SubnetGenerator.
+    :returns: List of (subnet, routers of the loop) for every forwarding loop.
+    """
+    owner = {}
+    for net, desc in networks.items():
+        for br, ip_net in desc.ip_net.items():
+            owner[str(ip_net.ip)] = br
+    tables = {}
+    prefix_lens = set()
+    for br, br_routes in routes.items():
+        tables[br] = {}
+        for net, next_hop in br_routes:
+            net = ip_network(net)
+            tables[br][net] = owner[next_hop]
+            prefix_lens.add(net.prefixlen)
+    prefix_lens = sorted(prefix_lens, reverse=True)
+    loops = []
+    for net, desc in sorted(networks.items(), key=lambda x: (x[0].version, x[0])):
+        supernets = [net.supernet(new_prefix=length) for length in prefix_lens
+                     if length <= net.prefixlen]
+
+        def next_router(br):
+            for supernet in supernets:
+                if supernet in tables.get(br, ()):
+                    return tables[br][supernet]
+            return None
+
+        # Walks of earlier routers end in done, those of this router in path.
+        done = set(ast.literal_eval(desc.name))
+        for br in sorted(tables):
+            path = []
+            on_path = set()
+            cur = br
+            while cur is not None and cur not in done and cur not in on_path:
+                path.append(cur)
+                on_path.add(cur)
+                cur = next_router(cur)
+            if cur in on_path:
+                loops.append((str(net), path[path.index(cur):]))
+            done.update(path)
+    return loops
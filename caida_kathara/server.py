@@ -0,0 +1,274 @@
+"""
+:mod:`server` --- Resident lab generator
+=============================================
+Serves generation requests on a localhost HTTP port and keeps the parsed
+CAIDA topologies and their border router clusterings in memory between
+requests, so repeated runs on the same snapshot only pay for address
+allocation and rendering.
+
+- ``POST /generate`` with a JSON object ``{"options": {...}, "write": true}``.
+  Requests need ``Content-Type: application/json`` and a Host header with a
+  loopback name and the port of the server.
+  The options are command line options by attribute name, see
+  api.config_args. With ``write`` the lab goes to the output directory or
+  archive of the options, otherwise its files are returned in the response.
+- ``GET /metrics``: request counts, latencies and cache hits.
+
+Topologies are cached by path, modification time and size, so an updated
+file is parsed again.
+"""
+# Stdlib
+import base64
+import ipaddress
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from caida_kathara.api import config_args
+from caida_kathara.common import ArgsBase
+from caida_kathara.config import ConfigGenerator
+from caida_kathara.topo import TopoCache
+from caida_kathara.util import lab_writer
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8470
+
+#: Number of recent requests the latency percentiles are computed over
+LATENCY_WINDOW = 1000
+
+CACHE_PHASES = ('parse', 'clustering')
+
+
+class ServerArgs(ArgsBase):
+    pass
+
+
+class GenerationError(Exception):
+    pass
+
+
+class GeneratorService(object):
+    """
+    Runs generation requests one at a time against the warm topology caches.
+    """
+
+    def __init__(self, cache_size=4):
+        """
+        :param int cache_size: Number of topology snapshots kept in memory.
+        """
+        self.cache_size = cache_size
+        self.caches = OrderedDict()
+        # Serializes the generation, while stats_lock keeps the metrics
+        # available during long runs.
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.max_latency = 0.0
+        self.cache_stats = {phase: {"hits": 0, "misses": 0} for phase in CACHE_PHASES}
+
+    def preload(self, caida_config):
+        """
+        Parse a topology and cluster its border routers ahead of the first
+        request, with the default clustering. Nothing is allocated or
+        rendered, and the request metrics are left untouched.
+        """
+        with self.lock:
+            args = config_args(caida_config=caida_config)
+            confgen = ConfigGenerator(args, topo_cache=self._topo_cache(args.caida_config))
+            confgen.warm_topo_cache()
+        logging.info("Preloaded %s", caida_config)
+
+    def generate(self, options, write=False):
+        """
+        Generate a lab.
+
+        :param dict options: Command line options by attribute name.
+        :param bool write: Write the lab to its output directory or archive
+            instead of returning its files.
+        :returns: A dict with the latency, the cache status of every phase,
+            and the output path or the files of the lab.
+        """
+        start = time.monotonic()
+        try:
+            with self.lock:
+                args = config_args(**options)
+                confgen = ConfigGenerator(args, topo_cache=self._topo_cache(args.caida_config))
+                lab = confgen.generate_lab()
+                result = self._output(lab, args, write)
+        except SystemExit:
+            # The generator logs the reason before exiting.
+            self._record_error()
+            raise GenerationError("generation failed, see the server log")
+        except (OSError, TypeError, ValueError) as e:
+            self._record_error()
+            logging.warning("Rejected generation request: %s", e)
+            raise GenerationError(str(e)) from e
+        except Exception as e:
+            self._record_error()
+            logging.exception("Generation failed")
+            raise GenerationError(str(e)) from e
+        latency = time.monotonic() - start
+        with self.stats_lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            self.max_latency = max(self.max_latency, latency)
+            for phase, status in confgen.cache_status.items():
+                self.cache_stats[phase]["hits" if status == "hit" else "misses"] += 1
+        result.update(latency=latency, cache=confgen.cache_status)
+        logging.info("Generated %s in %.3fs (%s)", args.caida_config, latency,
+                     ", ".join("%s %s" % item for item in sorted(confgen.cache_status.items())))
+        return result
+
+    def metrics(self):
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "latency": {
+                    "last": self.latencies[-1] if self.latencies else None,
+                    "mean": sum(latencies) / len(latencies) if latencies else None,
+                    "p50": _percentile(latencies, 0.5),
+                    "p95": _percentile(latencies, 0.95),
+                    "max": self.max_latency,
+                },
+                "cache": {phase: dict(stats) for phase, stats in self.cache_stats.items()},
+                "cached_topologies": [path for path, _, _ in list(self.caches)],
+            }
+
+    def _record_error(self):
+        with self.stats_lock:
+            self.requests += 1
+            self.errors += 1
+
+    def _topo_cache(self, caida_config):
+        path = os.path.abspath(caida_config)
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        if key not in self.caches:
+            for old in [k for k in self.caches if k[0] == path]:
+                del self.caches[old]
+            self.caches[key] = TopoCache()
+            while len(self.caches) > self.cache_size:
+                self.caches.popitem(last=False)
+        self.caches.move_to_end(key)
+        return self.caches[key]
+
+    def _output(self, lab, args, write):
+        if write:
+            writer = lab_writer(args.output_dir, args.output_archive)
+            try:
+                lab.write(writer)
+            finally:
+                writer.close()
+            return {"output": args.output_archive or args.output_dir}
+        files = {}
+        binary_files = {}
+        for rel_path, content in lab.iter_files():
+            if isinstance(content, bytes):
+                binary_files[rel_path] = base64.b64encode(content).decode()
+            else:
+                files[rel_path] = content
+        return {"files": files, "binary_files": binary_files}
+
+
+class GeneratorRequestHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    service = None
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self._reply(404, {"error": "unknown path %s" % self.path})
+            return
+        self._reply(200, self.service.metrics())
+
+    def do_POST(self):
+        if self.path != '/generate':
+            self._reply(404, {"error": "unknown path %s" % self.path})
+            return
+        # Browsers send cross-origin form posts without a preflight and follow
+        # DNS rebinding to loopback, so only JSON requests addressed to this
+        # server are served.
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            self._reply(415, {"error": "the request must be application/json"})
+            return
+        if not self._local_host():
+            self._reply(403, {"error": "unexpected Host %s" % self.headers.get('Host')})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("the request must be an object")
+            options = request.get("options", {})
+            if not isinstance(options, dict):
+                raise ValueError("options must be an object")
+        except ValueError as e:
+            self._reply(400, {"error": "bad request: %s" % e})
+            return
+        try:
+            result = self.service.generate(options, bool(request.get("write", False)))
+        except GenerationError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        self._reply(200, result)
+
+    def _local_host(self):
+        """
+        Returns whether the Host header names a loopback address with the port of
+        the server.
+        """
+        host, sep, port = (self.headers.get('Host') or '').rpartition(':')
+        if not sep or port != str(self.server.server_address[1]):
+            return False
+        if host.startswith('[') and host.endswith(']'):
+            host = host[1:-1]
+        return is_loopback(host.lower())
+
+    def _reply(self, status, body):
+        data = json.dumps(body, sort_keys=True).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug("%s %s", self.address_string(), format % args)
+
+
+def make_server(args, service=None):
+    """
+    :param ServerArgs args: Contains the passed command line arguments.
+    :param GeneratorService service: Overrides the service created from args.
+    """
+    # Requests read and write arbitrary paths, so only local clients are served.
+    if not is_loopback(args.host):
+        logging.critical("Refusing to listen on non-loopback address %s", args.host)
+        sys.exit(1)
+    handler = type('Handler', (GeneratorRequestHandler,),
+                   {"service": service or GeneratorService(args.cache_size)})
+    return ThreadingHTTPServer((args.host, args.port), handler)
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
@@ -17,7 +17,9 @@
 =============================================
 """
 # Stdlib
+import pickle
 import logging
+import math
 import sys
 from collections import defaultdict
 from itertools import combinations
@@ -29,13 +31,17 @@ from caida_kathara.common import (
 from caida_kathara.net import (
     SubnetGenerator
 )
-from caida_kathara.util import calculate_great_circle_latency
+from caida_kathara.util import calculate_great_circle_latency, cluster_locations
 
 ADDR_TYPE_4 = 'IPv4'
 ADDR_TYPE_6 = 'IPv6'
 
 MAX_LATENCY_SAME_BR = 0.2 #ms
 
+#: Border router clustering modes
+BR_CLUSTERING_GREEDY = 'greedy'
+BR_CLUSTERING_BATCH = 'batch'
+
 
 class TopoGenArgs(ArgsBase):
     def __init__(self,
@@ -51,29 +57,71 @@ class TopoGenArgs(ArgsBase):
         """
         super().__init__(args)
         
-        self.caida_config_root = caida_config.getroot()
+        self.caida_config_root = caida_config.getroot() if caida_config is not None else None
         self.subnet_gen = {
             ADDR_TYPE_4: subnet_gen4,
             ADDR_TYPE_6: subnet_gen6,
         }
 
 
+class TopoCache(object):
+    """
+    Parsed CAIDA config and border router clusterings of one topology, kept
+    across generator runs. Entries are stored pickled, which is compact and
+    gives every run its own copy to extend while building the topo dicts.
+
+    Entry names are "parse" for the caida_config_dict and "clustering-<mode>"
+    for the (links, assigned_br_per_as, br_locations) of a clustering mode.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def has(self, name):
+        return name in self.entries
+
+    def load(self, name):
+        """
+        :returns: The pickled entry, or None.
+        """
+        return self.entries.get(name)
+
+    def store(self, name, data):
+        self.entries[name] = data
+
+
 class TopoGenerator(object):
-    def __init__(self, args):
+    def __init__(self, args, cache=None):
         """
         :param TopoGenArgs args: Contains the passed command line arguments.
+        :param TopoCache cache: Reuses the parsed config and clusterings of
+            earlier runs on the same topology, and stores those of this run.
         """
         self.args = args
+        self.cache = cache
+        # Phase to "hit" or "miss" when running with a cache
+        self.cache_status = {}
         self.caida_dicts = {}
         self.hosts = []
         self.virt_addrs = set()
         self.as_list = defaultdict(list)
         self.links = defaultdict(list)
         self.assigned_br_per_as = defaultdict(dict)
+        # Router locations that differ from the first link location
+        self.br_locations = {}
+        # Chassis of split routers, by (router, neighbor router)
+        self.chassis = {}
+        self.chassis_groups = {}
 
         self._caiada_config_dict()
 
     def _caiada_config_dict(self):
+        cached = self._cache_load("parse", "parse")
+        if cached is not None:
+            self.args.caida_config_dict = cached
+            for id in self.args.caida_config_dict["ASes"]:
+                self.assigned_br_per_as[id] = {}
+            return
         self.args.caida_config_dict = {
             "ASes": {},
             "links": []
@@ -101,6 +149,18 @@ class TopoGenerator(object):
                     else:
                         link[prop.tag] = self._get_property_value(prop)
                 self.args.caida_config_dict["links"].append(link)
+        if self.cache is not None:
+            self.cache.store("parse", pickle.dumps(self.args.caida_config_dict))
+
+    def _cache_load(self, phase, name):
+        """
+        :returns: The unpickled cache entry, or None.
+        """
+        if self.cache is None:
+            return None
+        data = self.cache.load(name)
+        self.cache_status[phase] = "miss" if data is None else "hit"
+        return None if data is None else pickle.loads(data)
 
     def _get_property_value(self, prop):
         # check if attribute type is present
@@ -132,17 +192,26 @@ class TopoGenerator(object):
         else:
             return val_f(elem)
 
-    def _reg_link_addrs(self, local_br, remote_br, addr_type):
+    def _reg_link_addrs(self, local_br, remote_br, addr_type, group=None):
         link_name = str(sorted((local_br, remote_br)))
-        subnet = self.args.subnet_gen[addr_type].register(link_name)
+        subnet = self.args.subnet_gen[addr_type].register(link_name, group)
         return subnet.register(local_br), subnet.register(remote_br)
 
     def _iterate(self, f):
         for as_id, as_conf in self.args.caida_config_dict["ASes"].items():
             f(as_id, as_conf)
 
+    def cluster(self):
+        """
+        Only cluster the border routers, which fills the cache without
+        allocating any addresses.
+        """
+        self._read_links()
+
     def generate(self):
         self._read_links()
+        if self.args.max_interfaces is not None:
+            self._split_routers()
         # in a first step we allocate all networks, so that we can later use
         # the IPs in the generate functions.
         self._iterate(self._register_addrs)
@@ -170,12 +239,84 @@ class TopoGenerator(object):
         for l_br, r_br in combinations(self.assigned_br_per_as[as_id], 2):
                 self._register_br_entry(as_id, as_id, LinkRel.SIBLING, {}, 
                                         l_br, r_br, addr_type)
-            
+        # join the chassis of split border routers
+        for br in self.assigned_br_per_as[as_id]:
+            if br in self.chassis_groups:
+                self._reg_lan_addrs(self.chassis_groups[br], addr_type, self._addr_group(as_id))
+
 
     def _register_br_entry(self, local, remote, remote_type, attrs,
                            local_br, remote_br, addr_type):
         link_addr_type = ADDR_TYPE_6 if self.args.ipv6 else ADDR_TYPE_4
-        self._reg_link_addrs(local_br, remote_br, link_addr_type)
+        self._reg_link_addrs(self._chassis(local_br, remote_br),
+                             self._chassis(remote_br, local_br), link_addr_type,
+                             self._addr_group(local, remote))
+
+    def _reg_lan_addrs(self, brs, addr_type, group=None):
+        subnet = self.args.subnet_gen[addr_type].register(str(sorted(brs)), group)
+        for br in brs:
+            subnet.register(br)
+
+    def _addr_group(self, *as_ids):
+        """
+        With static routes, the subnets of an AS and its inter-AS links
+        towards ASes with higher ids get one address block per AS, so other
+        ASes reach all of them through a single route.
+        """
+        if not self.args.static_routes:
+            return None
+        return min(as_ids)
+
+    def _chassis(self, br, neighbor_br):
+        return self.chassis.get((br, neighbor_br), br)
+
+    def _split_routers(self):
+        """
+        Split border routers with more than max_interfaces interfaces into
+        co-located chassis joined by a local collision domain. Neighbors are
+        spread over the chassis ordered by location, the first chassis keeps
+        the router name and the others get a _<n> suffix.
+        """
+        locations = {}
+        for as_brs in self.assigned_br_per_as.values():
+            for br, conf in as_brs.items():
+                locations[br] = (conf["latitude"], conf["longitude"])
+        per_chassis = self.args.max_interfaces - 1
+        split = 0
+        for as_id, as_brs in self.assigned_br_per_as.items():
+            for br, conf in as_brs.items():
+                neighbors = [nb for nb in conf if nb not in ("latitude", "longitude")]
+                neighbors += [nb for nb in as_brs if nb != br]
+                if len(neighbors) <= self.args.max_interfaces:
+                    continue
+                num_chassis = math.ceil(len(neighbors) / per_chassis)
+                size = math.ceil(len(neighbors) / num_chassis)
+                names = [br] + ["%s_%d" % (br, i) for i in range(2, num_chassis + 1)]
+                ordered = sorted(neighbors, key=lambda nb: (locations[nb], nb))
+                for i, nb in enumerate(ordered):
+                    self.chassis[(br, nb)] = names[i // size]
+                self.chassis_groups[br] = names
+                split += 1
+        if split:
+            logging.info("Split %d border routers into %d chassis", split,
+                         sum(len(names) for names in self.chassis_groups.values()))
+
+    def _chassis_routers(self, as_id):
+        """
+        The routers of an AS with split routers replaced by their chassis.
+        """
+        routers = {}
+        for br, conf in self.assigned_br_per_as[as_id].items():
+            for name in self.chassis_groups.get(br, [br]):
+                routers[name] = {
+                    "latitude": conf["latitude"],
+                    "longitude": conf["longitude"],
+                }
+            for remote, details in conf.items():
+                if remote in ("latitude", "longitude"):
+                    continue
+                routers[self._chassis(br, remote)][self._chassis(remote, br)] = details
+        return routers
 
     def _br_name(self, as_id, lat, long, br_per_as, br_ids):
         br_id = self._nearest_br(as_id, lat, long, br_per_as)
@@ -199,11 +340,52 @@ class TopoGenerator(object):
         return None
         
 
+    def _greedy_br_names(self):
+        br_per_as = defaultdict(lambda: defaultdict(tuple))
+        br_ids = defaultdict(int)
+        return lambda as_id, lat, long: self._br_name(as_id, lat, long, br_per_as, br_ids)
+
+    def _batch_br_names(self):
+        """
+        Cluster all link locations of each AS in one batch, independently of
+        the link order, and return the lookup from location to router name.
+        """
+        locations = defaultdict(list)
+        for attrs in self.args.caida_config_dict["links"]:
+            loc = (attrs.get("latitude"), attrs.get("longitude"))
+            locations[attrs.get("from")].append(loc)
+            locations[attrs.get("to")].append(loc)
+        br_names = {}
+        for as_id, as_locations in locations.items():
+            centers, assignment = cluster_locations(as_locations, MAX_LATENCY_SAME_BR)
+            for loc, idx in assignment.items():
+                br_names[(as_id, loc)] = "br%s_%d" % (str(as_id), idx + 1)
+            for idx, center in enumerate(centers):
+                self.br_locations["br%s_%d" % (str(as_id), idx + 1)] = center
+        self._log_clustering_savings(len(set(br_names.values())))
+        return lambda as_id, lat, long: br_names[(as_id, (lat, long))]
+
+    def _log_clustering_savings(self, num_brs):
+        greedy_br_name = self._greedy_br_names()
+        greedy_brs = set()
+        for attrs in self.args.caida_config_dict["links"]:
+            for as_id in (attrs.get("from"), attrs.get("to")):
+                greedy_brs.add(greedy_br_name(as_id, attrs.get("latitude"), attrs.get("longitude")))
+        logging.info("Batch clustering: %d border routers (greedy: %d), %d containers saved",
+                     num_brs, len(greedy_brs), len(greedy_brs) - num_brs)
+
     def _read_links(self):
         if not self.args.caida_config_dict.get("links", None):
             return
-        br_per_as = defaultdict(lambda: defaultdict(tuple))
-        br_ids = defaultdict(int)
+        cache_name = "clustering-%s" % self.args.br_clustering
+        cached = self._cache_load("clustering", cache_name)
+        if cached is not None:
+            self.links, self.assigned_br_per_as, self.br_locations = cached
+            return
+        if self.args.br_clustering == BR_CLUSTERING_BATCH:
+            br_name = self._batch_br_names()
+        else:
+            br_name = self._greedy_br_names()
         for attrs in self.args.caida_config_dict["links"]:
             as_from = attrs.get("from")
             as_to = attrs.get("to")
@@ -214,10 +396,8 @@ class TopoGenerator(object):
                 linkto_to = LinkRel.CUSTOMER
             lat = attrs.get("latitude")
             long = attrs.get("longitude")
-            from_br = self._br_name(as_from, lat, long,
-                                    br_per_as, br_ids)
-            to_br = self._br_name(as_to, lat, long,
-                                  br_per_as, br_ids)
+            from_br = br_name(as_from, lat, long)
+            to_br = br_name(as_to, lat, long)
             self.links[as_from].append((linkto_to, as_to, attrs, from_br, to_br))
             self.links[as_to].append((linkto_from, as_from, attrs, from_br, to_br))
 
@@ -225,21 +405,40 @@ class TopoGenerator(object):
                     "capacity": attrs.get("capacity", None),
                 }
             if from_br not in self.assigned_br_per_as[as_from]:
+                br_lat, br_long = self.br_locations.get(from_br, (lat, long))
                 self.assigned_br_per_as[as_from][from_br] = {
-                    "latitude": lat,
-                    "longitude": long,
+                    "latitude": br_lat,
+                    "longitude": br_long,
                 }
             self.assigned_br_per_as[as_from][from_br][to_br] = link_details
 
             if to_br not in self.assigned_br_per_as[as_to]:
+                br_lat, br_long = self.br_locations.get(to_br, (lat, long))
                 self.assigned_br_per_as[as_to][to_br] = {
-                    "latitude": lat,
-                    "longitude": long,
+                    "latitude": br_lat,
+                    "longitude": br_long,
                 }
             self.assigned_br_per_as[as_to][to_br][from_br] = link_details
-
+        if self.cache is not None:
+            self.cache.store(cache_name, pickle.dumps(
+                (self.links, self.assigned_br_per_as, self.br_locations)))
 
     def _generate_as_topo(self, as_id, as_conf):
         self.caida_dicts[as_id] = self.args.caida_config_dict["ASes"][as_id]
-        self.caida_dicts[as_id]["routers"] = self.assigned_br_per_as[as_id]
+        if self.chassis_groups:
+            self.caida_dicts[as_id]["routers"] = self._chassis_routers(as_id)
+        else:
+            self.caida_dicts[as_id]["routers"] = self.assigned_br_per_as[as_id]
+        relationships = {}
+        for (linkto, remote, _, _, _) in self.links[as_id]:
+            relationships.setdefault(remote, linkto)
+        self.caida_dicts[as_id]["relationships"] = relationships
+        # Chassis of every split router, joined by a local collision domain
+        self.caida_dicts[as_id]["chassis_groups"] = [
+            self.chassis_groups[br] for br in self.assigned_br_per_as[as_id]
+            if br in self.chassis_groups]
+        # Address block of the AS, with static routes
+        addr_type = ADDR_TYPE_6 if self.args.ipv6 else ADDR_TYPE_4
+        self.caida_dicts[as_id]["prefix"] = \
+            self.args.subnet_gen[addr_type].group_blocks.get(as_id)
     
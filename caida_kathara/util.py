@@ -15,22 +15,130 @@
 :mod:`util` --- SCION utilities
 ===============================
 """
+import heapq
+import io
 import math
+import os
 import pathlib
+from collections import defaultdict
+from itertools import product
+
+#: Earth radius in kilometers
+EARTH_RADIUS = 6371
+#: Milliseconds of latency per kilometer
+LATENCY_PER_KM = 0.005
+#: Supported extensions of lab archives
+ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.xz', '.tar.zst')
 
 
 def write_file(file_path, text):
     """
     Write some text into file, creating its directory as needed.
     :param str file_path: the path to the file.
-    :param str text: the file content.
+    :param text: the file content, str or bytes.
     """
     # ":" is an illegal filename char on both windows and OSX, so disallow it globally to prevent
     # incompatibility.
     assert ":" not in file_path, file_path
 
     pathlib.Path(file_path).parent.mkdir(parents=True, exist_ok=True)
-    pathlib.Path(file_path).write_text(text)
+    if isinstance(text, bytes):
+        pathlib.Path(file_path).write_bytes(text)
+    else:
+        pathlib.Path(file_path).write_text(text)
+
+
+class DirWriter(object):
+    """
+    Writes lab files below an output directory.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def write(self, rel_path, text):
+        write_file(os.path.join(self.output_dir, rel_path), text)
+
+    def close(self):
+        pass
+
+
+class ArchiveWriter(object):
+    """
+    Streams lab files into a single tar archive, compressed according to the
+    archive extension (.tar, .tar.gz/.tgz, .tar.xz, .tar.zst). Members get
+    fixed ownership, permissions and mtimes, and the compression headers carry
+    no timestamp or file name, so identical inputs give identical archives.
+    """
+
+    def __init__(self, archive_path):
+        # Archive support is imported on demand, it is not needed for plain
+        # directory output.
+        import tarfile
+        self._tarfile = tarfile
+        compressor = _archive_compressor(archive_path)
+        pathlib.Path(archive_path).parent.mkdir(parents=True, exist_ok=True)
+        self._raw = open(archive_path, 'wb')
+        self._stream = compressor(self._raw)
+        self._tar = tarfile.open(fileobj=self._stream, mode='w', format=tarfile.PAX_FORMAT)
+
+    def write(self, rel_path, text):
+        assert ":" not in rel_path, rel_path
+        data = text if isinstance(text, bytes) else text.encode()
+        info = self._tarfile.TarInfo(pathlib.PurePosixPath(rel_path).as_posix())
+        info.size = len(data)
+        info.mtime = 0
+        info.mode = 0o644
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._tar.close()
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+
+
+def check_archive_path(archive_path):
+    """
+    Check that archives with the extension of archive_path can be written.
+
+    :raises ValueError: If the extension is not supported or its compressor is
+        not installed.
+    """
+    if not archive_path.endswith(ARCHIVE_EXTENSIONS):
+        raise ValueError("Unsupported archive extension: '%s', expected one of %s"
+                         % (archive_path, ", ".join(ARCHIVE_EXTENSIONS)))
+    if archive_path.endswith('.tar.zst'):
+        # Looked up without importing it, plain runs do not load zstandard.
+        import importlib.util
+        if importlib.util.find_spec('zstandard') is None:
+            raise ValueError("The zstandard package is required for '%s'" % archive_path)
+
+
+def _archive_compressor(archive_path):
+    check_archive_path(archive_path)
+    if archive_path.endswith(('.tar.gz', '.tgz')):
+        import gzip
+        return lambda raw: gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0)
+    if archive_path.endswith('.tar.xz'):
+        import lzma
+        return lambda raw: lzma.LZMAFile(raw, mode='wb')
+    if archive_path.endswith('.tar.zst'):
+        # Optional dependency, only needed for zstd archives.
+        import zstandard
+        return lambda raw: zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+    return lambda raw: raw
+
+
+def lab_writer(output_dir, output_archive=None):
+    """
+    Return the writer for the generated lab files.
+    :param str output_dir: the output directory, used if no archive is given.
+    :param str output_archive: path of the archive to stream the files into.
+    """
+    if output_archive:
+        return ArchiveWriter(output_archive)
+    return DirWriter(output_dir)
 
 
 def symlink(source, dest, is_dir=False):
@@ -49,8 +157,7 @@ def symlink(source, dest, is_dir=False):
 
 def calculate_great_circle_latency(lat1_deg, long1_deg, lat2_deg, long2_deg):
     distance = calculate_great_circle_distance(lat1_deg, long1_deg, lat2_deg, long2_deg)
-    # 0.005 millisecods of latency per kilometer
-    return distance * 0.005
+    return distance * LATENCY_PER_KM
 
 def calculate_great_circle_distance(lat1_deg, long1_deg, lat2_deg, long2_deg):
     lat1 = math.radians(lat1_deg)
@@ -62,10 +169,83 @@ def calculate_great_circle_distance(lat1_deg, long1_deg, lat2_deg, long2_deg):
     dlat = lat2 - lat1
     dlong = long2 - long1
 
-    distance = 2 * 6371 * math.asin(
+    distance = 2 * EARTH_RADIUS * math.asin(
         math.sqrt(
             math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlong / 2) ** 2
         )
     )
 
     return distance
+
+
+def cluster_locations(locations, max_latency):
+    """
+    Cluster (latitude, longitude) locations in one batch, so that every
+    location is within max_latency of its cluster center, which is itself one
+    of the locations. Centers are picked greedily by how many unclustered
+    locations they cover, which keeps the number of clusters low. The result
+    only depends on the set of locations, not on their order.
+    :param list locations: the (latitude, longitude) pairs to cluster.
+    :param float max_latency: the maximum latency in ms to the cluster center.
+    :returns: the sorted list of centers and a dict mapping every location to
+        the index of its center.
+    """
+    points = sorted(set(locations))
+    neighbors = _location_neighbors(points, max_latency)
+
+    # Greedy set cover with lazily updated coverage counts.
+    covered = [False] * len(points)
+    coverage = [len(n) for n in neighbors]
+    heap = [(-coverage[i], i) for i in range(len(points))]
+    heapq.heapify(heap)
+    center_ids = []
+    while heap:
+        count, i = heapq.heappop(heap)
+        if -count != coverage[i]:
+            heapq.heappush(heap, (-coverage[i], i))
+            continue
+        if not coverage[i]:
+            continue
+        center_ids.append(i)
+        for j in neighbors[i]:
+            if covered[j]:
+                continue
+            covered[j] = True
+            for k in neighbors[j]:
+                coverage[k] -= 1
+
+    center_ids.sort()
+    is_center = {i: idx for idx, i in enumerate(center_ids)}
+    assignment = {}
+    for i, point in enumerate(points):
+        # Nearest center, ties go to the first one.
+        assignment[point] = min(
+            (calculate_great_circle_latency(*point, *points[j]), is_center[j])
+            for j in neighbors[i] if j in is_center)[1]
+    return [points[i] for i in center_ids], assignment
+
+
+def _location_neighbors(points, max_latency):
+    """
+    For every point, the indices of the points within max_latency of it
+    (including itself), found through a grid over the unit sphere.
+    """
+    # Side of a grid cell: the chord length of the maximum distance.
+    cell = 2 * math.sin(max_latency / LATENCY_PER_KM / EARTH_RADIUS / 2) or 1.0
+    grid = defaultdict(list)
+    cells = []
+    for i, (lat, long) in enumerate(points):
+        lat, long = math.radians(lat), math.radians(long)
+        vec = (math.cos(lat) * math.cos(long), math.cos(lat) * math.sin(long), math.sin(lat))
+        key = tuple(math.floor(c / cell) for c in vec)
+        grid[key].append(i)
+        cells.append(key)
+    neighbors = []
+    for i, key in enumerate(cells):
+        near = []
+        for offset in product((-1, 0, 1), repeat=3):
+            for j in grid.get(tuple(k + o for k, o in zip(key, offset)), ()):
+                if calculate_great_circle_latency(*points[i], *points[j]) <= max_latency:
+                    near.append(j)
+        neighbors.append(sorted(near))
+    return neighbors
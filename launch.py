@@ -0,0 +1,61 @@
+"""
+:mod:`launch` --- Parallel launcher for generated Kathara labs
+=============================================
+"""
+# Stdlib
+import argparse
+import logging
+import sys
+
+from caida_kathara.defines import GEN_PATH
+from caida_kathara.launch import (
+    BACKENDS,
+    WAVE_BY_AS,
+    WAVE_BY_PARTITION,
+    Launcher,
+    LaunchArgs,
+    check_arguments,
+)
+
+
+def add_arguments(parser):
+    parser.add_argument('-d', '--lab-dir', default=GEN_PATH,
+                        help='Lab directory')
+    parser.add_argument('-j', '--concurrency', type=int, default=8,
+                        help='Maximum number of devices booting at the same time')
+    parser.add_argument('--wave-size', type=int, default=64,
+                        help='Number of devices per wave')
+    parser.add_argument('--wave-by', choices=[WAVE_BY_AS, WAVE_BY_PARTITION], default=WAVE_BY_AS,
+                        help='Pack whole ASes into waves (as) or split the AS-ordered '
+                             'device list into fixed-size waves (partition)')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='Number of retries for a device that fails to start')
+    parser.add_argument('--retry-delay', type=float, default=1.0,
+                        help='Base delay in seconds between retries')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='kathara',
+                        help='Backend used to start the devices')
+    parser.add_argument('--report',
+                        help='Path of the JSON boot report (default: <lab_dir>/launch_report.json)')
+    return parser
+
+
+def main():
+    """
+    Main function.
+    """
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        check_arguments(args)
+    except ValueError as e:
+        parser.error(str(e))
+    args = LaunchArgs(args)
+    launcher = Launcher(args)
+    if not launcher.launch():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
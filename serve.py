@@ -0,0 +1,52 @@
+"""
+:mod:`serve` --- Resident Kathara lab generator
+=============================================
+"""
+# Stdlib
+import argparse
+import logging
+
+from caida_kathara.server import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    GeneratorService,
+    ServerArgs,
+    make_server,
+)
+
+
+def add_arguments(parser):
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help='Loopback address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                        help='Port to listen on')
+    parser.add_argument('--cache-size', type=int, default=4,
+                        help='Number of CAIDA topologies kept in memory')
+    parser.add_argument('--preload', action='append', default=[],
+                        help='CAIDA topology to parse and cluster before serving (repeatable)')
+    return parser
+
+
+def main():
+    """
+    Main function.
+    """
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = ServerArgs(parser.parse_args())
+    service = GeneratorService(args.cache_size)
+    for caida_config in args.preload:
+        service.preload(caida_config)
+    server = make_server(args, service)
+    logging.info("Serving on http://%s:%d", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import random
+import unittest
+
+from caida_kathara.api import generate_lab
+from caida_kathara.topo import MAX_LATENCY_SAME_BR
+from caida_kathara.util import calculate_great_circle_latency, cluster_locations
+from topology import caida_topology, random_links
+
+CITIES = [(47.4, 8.5), (52.5, 13.4), (40.7, -74.0)]
+
+# Links of AS 1 along the equator, 0.135 degrees (about 15 km) apart: every
+# point is within MAX_LATENCY_SAME_BR (about 40 km) of its neighbors and of the
+# middle point, but not of both ends.
+CHAIN = [(0.0, 0.135 * i) for i in range(5)]
+
+
+def city_links(seed, num_ases, num_links):
+    """
+    Random links placed around a few cities, so that ASes have several links
+    per border router.
+    """
+    rnd = random.Random(seed)
+    links = []
+    for as_from, as_to, rel, _, _ in random_links(seed, num_ases, num_links):
+        lat, long = rnd.choice(CITIES)
+        links.append((as_from, as_to, rel, lat + rnd.uniform(-0.2, 0.2),
+                      long + rnd.uniform(-0.2, 0.2)))
+    return links
+
+
+def networks(lab):
+    return {net: (desc.name, desc.ip_net) for net, desc in lab.networks.items()}
+
+
+class BatchClusteringTest(unittest.TestCase):
+    def test_independent_of_link_order(self):
+        links = city_links(3, 8, 60)
+        lab = generate_lab(caida_topology(links), br_clustering="batch")
+        for seed in range(3):
+            shuffled = list(links)
+            random.Random(seed).shuffle(shuffled)
+            shuffled_lab = generate_lab(caida_topology(shuffled), br_clustering="batch")
+            self.assertEqual(shuffled_lab.devices, lab.devices)
+            self.assertEqual(networks(shuffled_lab), networks(lab))
+
+    def test_chain_in_one_cluster(self):
+        centers, assignment = cluster_locations(list(reversed(CHAIN)), MAX_LATENCY_SAME_BR)
+        self.assertEqual(centers, [CHAIN[2]])
+        self.assertEqual(assignment, {loc: 0 for loc in CHAIN})
+
+    def test_centers_within_max_latency(self):
+        rnd = random.Random(1)
+        locations = [(lat + rnd.uniform(-0.5, 0.5), long + rnd.uniform(-0.5, 0.5))
+                     for lat, long in CITIES for _ in range(30)]
+        centers, assignment = cluster_locations(locations, MAX_LATENCY_SAME_BR)
+        self.assertEqual(set(assignment), set(locations))
+        for loc, idx in assignment.items():
+            self.assertLessEqual(calculate_great_circle_latency(*loc, *centers[idx]),
+                                 MAX_LATENCY_SAME_BR)
+
+    def test_fewer_routers_than_greedy(self):
+        links = [(1, as_id, "customer", lat, long) for as_id, (lat, long) in enumerate(CHAIN, 2)]
+        brs = {}
+        for mode in ("greedy", "batch"):
+            lab = generate_lab(caida_topology(links), br_clustering=mode)
+            brs[mode] = [dev for dev in lab.devices if dev.startswith("br1_")]
+        # Greedy clustering centers a router on the first link and needs a
+        # second one for the far end of the chain.
+        self.assertEqual(len(brs["greedy"]), 2)
+        self.assertEqual(brs["batch"], ["br1_1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
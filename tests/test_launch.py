@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from caida_kathara.launch import (
+    LAUNCH_REPORT_FILE,
+    WAVE_BY_AS,
+    WAVE_BY_PARTITION,
+    LaunchArgs,
+    Launcher,
+    MockBackend,
+    check_arguments,
+    read_lab_devices,
+)
+
+DEVICES = ["br1_1", "br1_2", "br2_1", "br2_2", "br2_3", "br3_1", "br10_1"]
+
+
+class CountingBackend(MockBackend):
+    """
+    MockBackend that records how many devices boot at the same time.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def start(self, lab_dir, device):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            super().start(lab_dir, device)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class LauncherTest(unittest.TestCase):
+    def setUp(self):
+        self.lab_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.lab_dir, "lab.conf"), "w") as f:
+            f.write('LAB_DESCRIPTION="test"\n\n# Collision domains\n')
+            for i, dev in enumerate(reversed(DEVICES)):
+                f.write('%s[0]="%d"\n%s[image]="base"\n' % (dev, i, dev))
+
+    def tearDown(self):
+        shutil.rmtree(self.lab_dir)
+
+    def launcher(self, backend, **options):
+        args = dict(lab_dir=self.lab_dir, concurrency=2, wave_size=3, wave_by=WAVE_BY_AS,
+                    retries=2, retry_delay=0.0, backend="mock", report=None)
+        args.update(options)
+        return Launcher(LaunchArgs(check_arguments(argparse.Namespace(**args))), backend)
+
+    def test_invalid_arguments(self):
+        for option, value in (("concurrency", 0), ("wave_size", 0), ("retries", -1),
+                              ("retry_delay", -1.0)):
+            with self.assertRaises(ValueError):
+                self.launcher(MockBackend(), **{option: value})
+
+    def read_report(self):
+        with open(os.path.join(self.lab_dir, LAUNCH_REPORT_FILE)) as f:
+            return json.load(f)
+
+    def test_devices_ordered_by_as(self):
+        self.assertEqual(read_lab_devices(self.lab_dir), DEVICES)
+
+    def test_all_devices_started(self):
+        backend = MockBackend()
+        self.assertTrue(self.launcher(backend).launch())
+        self.assertEqual(sorted(backend.started), sorted(DEVICES))
+        report = self.read_report()
+        self.assertEqual(report["failed"], [])
+        self.assertEqual(sorted(report["devices"]), sorted(DEVICES))
+        for result in report["devices"].values():
+            self.assertTrue(result["ok"])
+            self.assertEqual(result["attempts"], 1)
+
+    def test_retries_after_cleanup(self):
+        # A failed start leaves the device deployed, so every retry would
+        # fail without the cleanup in between.
+        backend = MockBackend(failures={"br1_2": 2})
+        self.assertTrue(self.launcher(backend, retries=2).launch())
+        report = self.read_report()["devices"]["br1_2"]
+        self.assertEqual((report["ok"], report["attempts"], report["error"]), (True, 3, None))
+        self.assertIn("br1_2", backend.started)
+
+    def test_failure_after_retries(self):
+        backend = MockBackend(failures={"br2_1": 3})
+        self.assertFalse(self.launcher(backend, retries=2).launch())
+        report = self.read_report()
+        self.assertEqual(report["failed"], ["br2_1"])
+        self.assertEqual(report["devices"]["br2_1"]["attempts"], 3)
+        self.assertIn("mock failure", report["devices"]["br2_1"]["error"])
+        self.assertNotIn("br2_1", backend.started)
+        self.assertEqual(len(backend.started), len(DEVICES) - 1)
+
+    def test_waves_keep_ases_together(self):
+        launcher = self.launcher(MockBackend(), wave_size=3, wave_by=WAVE_BY_AS)
+        self.assertEqual(launcher._waves(DEVICES),
+                         [["br1_1", "br1_2"], ["br2_1", "br2_2", "br2_3"], ["br3_1", "br10_1"]])
+        # An AS larger than a wave gets a wave of its own.
+        self.assertEqual(launcher._waves(["br1_1", "br2_1", "br2_2", "br2_3", "br2_4"]),
+                         [["br1_1"], ["br2_1", "br2_2", "br2_3", "br2_4"]])
+
+    def test_waves_by_partition(self):
+        launcher = self.launcher(MockBackend(), wave_size=3, wave_by=WAVE_BY_PARTITION)
+        self.assertEqual(launcher._waves(DEVICES),
+                         [DEVICES[0:3], DEVICES[3:6], DEVICES[6:]])
+
+    def test_report_waves(self):
+        self.assertTrue(self.launcher(MockBackend(), wave_size=3).launch())
+        waves = {dev: res["wave"] for dev, res in self.read_report()["devices"].items()}
+        self.assertEqual(waves, {"br1_1": 0, "br1_2": 0, "br2_1": 1, "br2_2": 1, "br2_3": 1,
+                                 "br3_1": 2, "br10_1": 2})
+
+    def test_concurrency_bound(self):
+        backend = CountingBackend(boot_time=0.02)
+        self.assertTrue(self.launcher(backend, concurrency=2, wave_size=10,
+                                      wave_by=WAVE_BY_PARTITION).launch())
+        self.assertEqual(backend.max_running, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
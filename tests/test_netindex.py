@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from ipaddress import ip_interface, ip_network
+from types import SimpleNamespace
+
+from caida_kathara.api import generate_lab
+from caida_kathara.net import NetworkDescription
+from caida_kathara.netindex import NetworksIndex, build_networks_index
+from topology import caida_topology
+
+LINKS = [
+    (1, 2, "customer", 47.4, 8.5),
+    (1, 3, "peer", 52.5, 13.4),
+    (2, 3, "customer", 40.7, -74.0),
+    (2, 4, "customer", 47.4, 8.5),
+    (3, 4, "peer", 35.7, 139.7),
+]
+
+
+class NetworksIndexRoundTripTest(unittest.TestCase):
+    def _check_lab(self, lab):
+        index = NetworksIndex(build_networks_index(lab))
+        self.assertEqual(index.if_name, lab.if_name)
+        for cd in lab.collision_domains.values():
+            net = cd["network"]
+            members = lab.networks[net].ip_net
+            link = sorted(members)
+            # Longest-prefix match of every address of the subnet.
+            for addr in (net.network_address, net.broadcast_address):
+                found = index.lookup(addr)
+                self.assertEqual(found.network, net)
+                self.assertEqual(found.link, link)
+                self.assertEqual(sorted(i.device for i in found.interfaces), link)
+            # Reverse lookup of every interface address.
+            for dev, if_id in cd["devices"].items():
+                iface = index.interface(str(members[dev].ip))
+                self.assertEqual(iface.device, dev)
+                self.assertEqual(iface.ifname, "%s%d" % (lab.if_name, if_id))
+                self.assertEqual(iface.address, members[dev].ip)
+                self.assertEqual(iface.network, net)
+                self.assertEqual(iface.link, link)
+        # Device lookup, ordered by interface id.
+        for dev, info in lab.devices.items():
+            ifaces = index.device_interfaces(dev)
+            self.assertEqual([i.ifname for i in ifaces],
+                             ["%s%d" % (lab.if_name, if_id) for if_id in sorted(info["interfaces"])])
+        self.assertEqual(index.device_interfaces("br99_1"), [])
+        return index
+
+    def test_ipv4(self):
+        lab = generate_lab(caida_topology(LINKS), network="10.0.0.0/8")
+        index = self._check_lab(lab)
+        self.assertIsNone(index.lookup("192.168.0.1"))
+        self.assertIsNone(index.interface("192.168.0.1"))
+        self.assertIsNone(index.interface("fd00::1"))
+
+    def test_ipv6(self):
+        lab = generate_lab(caida_topology(LINKS), ipv6=True)
+        index = self._check_lab(lab)
+        self.assertIsNone(index.lookup("fd00:ffff::1"))
+        self.assertIsNone(index.lookup("10.0.0.1"))
+
+    def test_longest_prefix_match(self):
+        lan = ip_network("10.1.0.0/29")
+        link = ip_network("10.1.0.0/31")
+        networks = {
+            lan: NetworkDescription("['a', 'b', 'c']", {
+                "a": ip_interface("10.1.0.1/29"),
+                "b": ip_interface("10.1.0.2/29"),
+                "c": ip_interface("10.1.0.3/29"),
+            }),
+            link: NetworkDescription("['a', 'd']", {
+                "a": ip_interface("10.1.0.0/31"),
+                "d": ip_interface("10.1.0.1/31"),
+            }),
+        }
+        lab = SimpleNamespace(
+            if_name="eth",
+            devices={"a": {}, "b": {}, "c": {}, "d": {}},
+            networks=networks,
+            collision_domains={
+                "0": {"network": lan, "devices": {"a": 0, "b": 0, "c": 0}},
+                "1": {"network": link, "devices": {"a": 1, "d": 0}},
+            })
+        index = NetworksIndex(build_networks_index(lab))
+        self.assertEqual(index.lookup("10.1.0.1").network, link)
+        self.assertEqual(index.lookup("10.1.0.5").network, lan)
+        self.assertEqual(index.lookup("10.1.0.5").link, ["a", "b", "c"])
+        self.assertIsNone(index.lookup("10.1.0.8"))
+        self.assertEqual([(i.ifname, i.network) for i in index.device_interfaces("a")],
+                         [("eth0", lan), ("eth1", link)])
+
+    def test_open_file(self):
+        lab = generate_lab(caida_topology(LINKS))
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(build_networks_index(lab))
+            with NetworksIndex.open(path) as index:
+                net = next(iter(lab.networks))
+                self.assertEqual(index.lookup(next(net.hosts())).network, net)
+        finally:
+            os.remove(path)
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            NetworksIndex(b"\0" * 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
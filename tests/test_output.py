@@ -0,0 +1,128 @@
+import importlib.util
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import xml.etree.ElementTree as et
+from unittest import mock
+
+from caida_kathara.api import config_args, generate_lab, write_lab
+from caida_kathara.checkpoint import CHECKPOINT_DIR
+from caida_kathara.config import ConfigGenerator
+from caida_kathara.util import DirWriter, write_file
+from topology import random_topology
+
+
+def read_tree(root):
+    """
+    Files below root by their path relative to it.
+    """
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_archive(self, name):
+        path = os.path.join(self.tmp_dir, name)
+        write_lab(generate_lab(random_topology(1, 6, 20), static_routes=True),
+                  output_archive=path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def check_archive(self, extension):
+        data = self.write_archive('first' + extension)
+        self.assertEqual(self.write_archive('second' + extension), data)
+        # Same files as the directory output.
+        lab_dir = os.path.join(self.tmp_dir, 'lab')
+        write_lab(generate_lab(random_topology(1, 6, 20), static_routes=True), lab_dir)
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            files = {m.name: tar.extractfile(m).read() for m in tar.getmembers()}
+        self.assertEqual(files, read_tree(lab_dir))
+
+    def test_tar(self):
+        self.check_archive('.tar')
+
+    def test_gzip(self):
+        self.check_archive('.tar.gz')
+
+    def test_xz(self):
+        self.check_archive('.tar.xz')
+
+    @unittest.skipUnless(importlib.util.find_spec('zstandard'), "zstandard is not installed")
+    def test_zstd(self):
+        data = self.write_archive('first.tar.zst')
+        self.assertEqual(self.write_archive('second.tar.zst'), data)
+
+    def test_unsupported_extension(self):
+        with self.assertRaises(ValueError):
+            self.write_archive('lab.zip')
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # Checkpoints are tied to a topology file.
+        self.caida_config = os.path.join(self.tmp_dir, 'topology.xml')
+        et.ElementTree(random_topology(2, 8, 30)).write(self.caida_config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def generate(self, name, **options):
+        output_dir = os.path.join(self.tmp_dir, name)
+        ConfigGenerator(config_args(caida_config=self.caida_config, output_dir=output_dir,
+                                    static_routes=True, **options)).generate_all()
+        return output_dir
+
+    def test_resume_after_interruption(self):
+        clean = read_tree(self.generate('clean'))
+        written = []
+        fail_at = [len(clean) // 2]
+
+        def failing_write(writer, rel_path, text):
+            written.append(rel_path)
+            path = os.path.join(writer.output_dir, rel_path)
+            if len(written) == fail_at[0]:
+                # The interrupted file is left truncated.
+                write_file(path, text[:len(text) // 2])
+                raise Interrupted(rel_path)
+            write_file(path, text)
+
+        with mock.patch.object(DirWriter, 'write', failing_write):
+            with self.assertRaises(Interrupted):
+                self.generate('lab', checkpoint=True)
+        output_dir = os.path.join(self.tmp_dir, 'lab')
+        self.assertTrue(os.path.isdir(os.path.join(output_dir, CHECKPOINT_DIR)))
+        self.assertNotEqual(read_tree(output_dir), clean)
+
+        completed, interrupted = written[:-1], written[-1]
+        del written[:]
+        fail_at[0] = None
+        with mock.patch.object(DirWriter, 'write', failing_write):
+            self.generate('lab', checkpoint=True, resume=True)
+        # Only the interrupted file and the ones after it are written again,
+        # and the checkpoint is removed.
+        self.assertIn(interrupted, written)
+        self.assertFalse(set(completed) & set(written))
+        self.assertEqual(len(completed) + len(written), len(clean))
+        self.assertEqual(read_tree(output_dir), clean)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import random
+import unittest
+
+from caida_kathara.api import generate_lab
+from caida_kathara.common import LinkRel
+from caida_kathara.kathara import STATIC_ROUTES_FILE
+from caida_kathara.routing import ASGraph, find_route_loops, valley_free_paths
+from topology import random_topology
+
+C, P, PEER = LinkRel.CUSTOMER, LinkRel.PROVIDER, LinkRel.PEER
+
+# Provider to customer and peer links of a small hierarchy:
+#
+#         1 ---- 2             tier 1, peers
+#        / \      \
+#       3   8     10
+#      / \   \     \
+#     5   6  9     11 -- 3 is a customer of 11
+#      \
+#       4 (peer of 6)
+#
+PROVIDERS = [(1, 3), (1, 8), (2, 10), (3, 5), (3, 6), (8, 9), (10, 11), (11, 3)]
+PEERS = [(1, 2), (4, 6)]
+
+RANK = {"up": 0, "peer": 1, "down": 2}
+
+
+def relationships(providers, peers):
+    rels = {}
+    for provider, customer in providers:
+        rels.setdefault(provider, {})[customer] = C
+        rels.setdefault(customer, {})[provider] = P
+    for a, b in peers:
+        rels.setdefault(a, {})[b] = PEER
+        rels.setdefault(b, {})[a] = PEER
+    return rels
+
+
+def hop_kind(graph, u, v):
+    if v in graph.providers[u]:
+        return "up"
+    if v in graph.customers[u]:
+        return "down"
+    assert v in graph.peers[u], (u, v)
+    return "peer"
+
+
+class BestPathsTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = ASGraph(relationships(PROVIDERS, PEERS))
+        self.index = {as_id: i for i, as_id in enumerate(self.graph.as_ids)}
+
+    def path(self, src, dest):
+        next_hop, length = self.graph.best_paths(self.index[dest])
+        if length[self.index[src]] < 0:
+            return None
+        path = [src]
+        while path[-1] != dest:
+            path.append(self.graph.as_ids[next_hop[self.index[path[-1]]]])
+        self.assertEqual(len(path) - 1, length[self.index[src]])
+        return path
+
+    def assert_valley_free(self, graph):
+        for dest in range(len(graph.as_ids)):
+            next_hop, length = graph.best_paths(dest)
+            for src in range(len(graph.as_ids)):
+                if length[src] < 0:
+                    continue
+                kinds = []
+                u = src
+                while u != dest:
+                    kinds.append(hop_kind(graph, u, next_hop[u]))
+                    u = next_hop[u]
+                self.assertEqual(len(kinds), length[src])
+                # Up hops, at most one peer hop, then down hops.
+                self.assertEqual(kinds, sorted(kinds, key=RANK.get))
+                self.assertLessEqual(kinds.count("peer"), 1)
+
+    def test_valley_free(self):
+        self.assert_valley_free(self.graph)
+
+    def test_random_graphs_valley_free(self):
+        rnd = random.Random(1)
+        for _ in range(20):
+            # Providers have lower ids, so the hierarchy has no cycles.
+            pairs = {tuple(sorted(rnd.sample(range(30), 2))) for _ in range(60)}
+            providers = [p for p in pairs if rnd.random() < 0.7]
+            peers = [p for p in pairs if p not in providers]
+            self.assert_valley_free(ASGraph(relationships(providers, peers)))
+
+    def test_customer_routes_climb(self):
+        self.assertEqual(self.path(5, 1), [5, 3, 1])
+        self.assertEqual(self.path(9, 2), [9, 8, 1, 2])
+
+    def test_peer_routes_only_reach_customers(self):
+        # 4 only learns the customer routes of its peer 6.
+        self.assertEqual(self.path(4, 6), [4, 6])
+        self.assertIsNone(self.path(4, 3))
+        self.assertIsNone(self.path(4, 1))
+        # Routes learned from a peer are not exported to providers.
+        self.assertIsNone(self.path(3, 4))
+        self.assertIsNone(self.path(2, 4))
+        # Customer routes are exported to peers.
+        self.assertEqual(self.path(2, 9), [2, 1, 8, 9])
+
+    def test_customer_route_preferred_over_shorter_route(self):
+        # 2 reaches 3 through its customer 10 rather than its peer 1.
+        self.assertEqual(self.path(2, 3), [2, 10, 11, 3])
+        # Between provider routes, 3 takes the shorter one through 1.
+        self.assertEqual(self.path(3, 2), [3, 1, 2])
+
+    def test_workers_match_single_process(self):
+        rnd = random.Random(2)
+        pairs = {tuple(sorted(rnd.sample(range(80), 2))) for _ in range(200)}
+        graph = ASGraph(relationships(sorted(pairs), []))
+        self.assertEqual(valley_free_paths(graph, workers=2), valley_free_paths(graph, workers=1))
+
+
+class StaticRoutesTest(unittest.TestCase):
+    def routes(self, lab):
+        routes = {}
+        for dev, info in lab.devices.items():
+            if STATIC_ROUTES_FILE in info["files"]:
+                # route add <subnet> via <next hop>
+                routes[dev] = [(line.split()[2], line.split()[4])
+                               for line in info["files"][STATIC_ROUTES_FILE].splitlines()]
+        return routes
+
+    def test_no_loops_with_split_routers(self):
+        for max_interfaces in (None, 2, 3):
+            lab = generate_lab(random_topology(3, 8, 30), static_routes=True,
+                               max_interfaces=max_interfaces, routing_workers=1)
+            self.assertEqual(find_route_loops(self.routes(lab), lab.networks), [])
+
+    def test_one_route_per_remote_as(self):
+        lab = generate_lab(random_topology(4, 10, 40), static_routes=True, routing_workers=1)
+        subnets = {str(net): set(desc.ip_net) for net, desc in lab.networks.items()}
+        for dev, dev_routes in self.routes(lab).items():
+            as_prefix = dev.split("_")[0] + "_"
+            nets = [net for net, _ in dev_routes]
+            self.assertEqual(len(nets), len(set(nets)))
+            # Subnets of the own AS block are routed one by one, each with a
+            # router of the AS, and other ASes through their block.
+            specific = [net for net in nets if net in subnets]
+            for net in specific:
+                self.assertTrue(any(br.startswith(as_prefix) for br in subnets[net]), net)
+                self.assertNotIn(dev, subnets[net])
+            self.assertLessEqual(len(nets) - len(specific), 9)
+
+    def test_loop_detected(self):
+        lab = generate_lab(random_topology(5, 6, 20), static_routes=True, routing_workers=1)
+        routes = self.routes(lab)
+        a, b = sorted(d for d in routes if d.startswith("br1_"))[:2]
+        link = next(desc for desc in lab.networks.values() if set(desc.ip_net) == {a, b})
+        target = next(net for net, _ in routes[a] if int(net.split("/")[1]) < 31)
+        routes[a].append((target, str(link.ip_net[b].ip)))
+        routes[b].append((target, str(link.ip_net[a].ip)))
+        loops = find_route_loops(routes, lab.networks)
+        self.assertTrue(loops)
+        self.assertEqual(sorted(loops[0][1]), [a, b])
+
+
+if __name__ == "__main__":
+    unittest.main()
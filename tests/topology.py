@@ -0,0 +1,45 @@
+"""
+Synthetic CAIDA topologies for the tests.
+"""
+import random
+import xml.etree.ElementTree as et
+
+
+def caida_topology(links, as_ids=None):
+    """
+    Build a CAIDA topology element.
+
+    :param links: (from AS, to AS, rel, latitude, longitude) tuples.
+    :param as_ids: ASes of the topology, by default the ASes of the links.
+    """
+    if as_ids is None:
+        as_ids = sorted({as_id for link in links for as_id in link[:2]})
+    root = et.Element("topology")
+    for as_id in as_ids:
+        et.SubElement(root, "node", {"id": str(as_id), "id.type": "int"})
+    for as_from, as_to, rel, lat, long in links:
+        link = et.SubElement(root, "link")
+        et.SubElement(link, "from", {"type": "int"}).text = str(as_from)
+        et.SubElement(link, "to", {"type": "int"}).text = str(as_to)
+        et.SubElement(link, "property", {"name": "rel"}).text = rel
+        et.SubElement(link, "property", {"name": "latitude", "type": "float"}).text = str(lat)
+        et.SubElement(link, "property", {"name": "longitude", "type": "float"}).text = str(long)
+    return root
+
+
+def random_links(seed, num_ases, num_links):
+    """
+    Random customer and peer links between ASes 1 to num_ases, the lower id
+    being the provider.
+    """
+    rnd = random.Random(seed)
+    links = []
+    for _ in range(num_links):
+        as_from, as_to = sorted(rnd.sample(range(1, num_ases + 1), 2))
+        rel = rnd.choice(["customer", "peer"])
+        links.append((as_from, as_to, rel, rnd.uniform(-60, 60), rnd.uniform(-170, 170)))
+    return links
+
+
+def random_topology(seed, num_ases, num_links):
+    return caida_topology(random_links(seed, num_ases, num_links), range(1, num_ases + 1))
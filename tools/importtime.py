@@ -0,0 +1,91 @@
+"""
+:mod:`importtime` --- Startup import benchmark
+=============================================
+Measures the import time of the generator entry point with `python -X importtime`
+and fails if modules that should only be loaded on demand are imported at
+startup, or if the import takes longer than the given budget.
+
+    python3 tools/importtime.py [--max-ms <budget>]
+"""
+# Stdlib
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#: Modules only needed by optional features (archives, docker helpers,
+#: static routing, BGP, the networks index and checkpoints); none of them
+#: may be imported by a plain run.
+LAZY_MODULES = [
+    'caida_kathara.bgp',
+    'caida_kathara.routing',
+    'caida_kathara.netindex',
+    'caida_kathara.checkpoint',
+    'subprocess',
+    'tarfile',
+    'gzip',
+    'lzma',
+    'bz2',
+    'zstandard',
+]
+
+
+def add_arguments(parser):
+    parser.add_argument('-m', '--module', default='caida_to_kathara',
+                        help='Module to import')
+    parser.add_argument('-r', '--runs', type=int, default=5,
+                        help='Number of runs, the fastest one is reported')
+    parser.add_argument('--max-ms', type=float,
+                        help='Fail if the import takes longer than this many milliseconds')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest modules to show')
+    return parser
+
+
+def import_times(module):
+    """
+    Import module in a fresh interpreter.
+
+    :returns: Mapping of imported module name to its cumulative import time in us.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                          cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          check=True)
+    times = {}
+    for line in proc.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    """
+    Main function.
+    """
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda t: t[args.module])
+    total_ms = best[args.module] / 1000
+    print("import %s: %.1f ms (best of %d)" % (args.module, total_ms, args.runs))
+    for name, us in sorted(best.items(), key=lambda x: -x[1])[1:args.top + 1]:
+        print("  %8.1f ms  %s" % (us / 1000, name))
+    ok = True
+    loaded = [name for name in LAZY_MODULES if name in best]
+    if loaded:
+        print("Modules loaded at startup that should be lazy: %s" % ", ".join(loaded))
+        ok = False
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print("Import time exceeds the budget of %.1f ms" % args.max_ms)
+        ok = False
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
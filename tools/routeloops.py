@@ -0,0 +1,63 @@
+"""
+:mod:`routeloops` --- Static routing loop check
+=============================================
+Generates a lab with static routes and split border routers and fails if
+following the routes of any router towards any subnet ends in a loop.
+
+    python3 tools/routeloops.py <caida_file> [--max-interfaces <n>] [--br-clustering batch]
+"""
+# Stdlib
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from caida_kathara.api import generate_lab  # noqa: E402
+from caida_kathara.kathara import STATIC_ROUTES_FILE  # noqa: E402
+from caida_kathara.routing import find_route_loops  # noqa: E402
+
+
+def add_arguments(parser):
+    parser.add_argument('caida_config',
+                        help='CAIDA topology to generate the lab from')
+    parser.add_argument('--max-interfaces', type=int, default=4,
+                        help='Split border routers with more interfaces into chassis (0: no split)')
+    parser.add_argument('--br-clustering', default='batch',
+                        help='Border router clustering mode')
+    parser.add_argument('--ipv6', action='store_true',
+                        help='Check an IPv6 lab')
+    parser.add_argument('--show', type=int, default=10,
+                        help='Number of loops to show')
+    return parser
+
+
+def main():
+    """
+    Main function.
+    """
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+    lab = generate_lab(args.caida_config, static_routes=True, ipv6=args.ipv6,
+                       max_interfaces=args.max_interfaces or None,
+                       br_clustering=args.br_clustering)
+    routes = {}
+    for dev, info in lab.devices.items():
+        if STATIC_ROUTES_FILE in info["files"]:
+            # route add <subnet> via <next hop>
+            routes[dev] = [(line.split()[2], line.split()[4])
+                           for line in info["files"][STATIC_ROUTES_FILE].splitlines()]
+    loops = find_route_loops(routes, lab.networks)
+    print("%d routers, %d routes, %d loops" % (
+        len(routes), sum(len(r) for r in routes.values()), len(loops)))
+    for net, path in loops[:args.show]:
+        print("  %s: %s" % (net, " -> ".join(path + path[:1])))
+    if loops:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()